@@ -0,0 +1,41 @@
+"""
+Request of the current thread or coroutine, set by EditSuggestionRequestMiddleware.
+"""
+import contextvars
+
+current_request = contextvars.ContextVar('edit_suggestion_request', default=None)
+
+
+def get_current_request():
+    return current_request.get()
+
+
+def get_current_user():
+    """The authenticated user of the current request or None"""
+    request = current_request.get()
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+class RequestHolder(object):
+    """
+    Keeps ``EditSuggestion.thread.request`` working on top of the context variable,
+    so the request doesn't leak between coroutines.
+    """
+
+    @property
+    def request(self):
+        request = current_request.get()
+        if request is None:
+            raise AttributeError('request')
+        return request
+
+    @request.setter
+    def request(self, request):
+        current_request.set(request)
+
+    @request.deleter
+    def request(self):
+        current_request.set(None)
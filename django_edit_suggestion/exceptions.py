@@ -18,3 +18,21 @@ class RelatedNameConflictError(Exception):
     """Related name conflicting with manager"""
 
     pass
+
+
+class EditSuggestionConflictError(Exception):
+    """The parent has been changed since the edit suggestion was made"""
+
+    def __init__(self, message, fields=None):
+        super(EditSuggestionConflictError, self).__init__(message)
+        # names of the conflicting fields, when known
+        self.fields = fields if fields else []
+
+
+class EditSuggestionDuplicateError(Exception):
+    """An identical edit suggestion of the parent is under review"""
+
+    def __init__(self, message, duplicate=None):
+        super(EditSuggestionDuplicateError, self).__init__(message)
+        # the edit suggestion under review with the same content
+        self.duplicate = duplicate
@@ -0,0 +1,150 @@
+"""
+Timing and query counts of the edit suggestion operations.
+
+Nothing is measured until a collector is set with ``set_collector``. A collector is any object with a
+``record(measurement)`` method, ``InMemoryCollector`` keeps percentiles in the process.
+"""
+import collections
+import functools
+import math
+import threading
+import time
+
+from django.db import connections, router
+
+# operation name, label of the edit suggestion model, wall time in seconds, number of queries,
+# rows touched (as reported by the database for the statements), whether it raised
+Measurement = collections.namedtuple('Measurement', 'operation model duration queries rows error')
+
+_collector = None
+
+
+def set_collector(collector):
+    """Sets the collector receiving the measurements, None disables the instrumentation"""
+    global _collector
+    _collector = collector
+
+
+def get_collector():
+    return _collector
+
+
+class Measure(object):
+    """Context manager measuring one operation on the database of the model"""
+
+    def __init__(self, operation, model, collector):
+        self.operation = operation
+        self.model = model
+        self.collector = collector
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute wrapper, counts the queries of the operation
+        self.queries += 1
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            rowcount = getattr(context['cursor'], 'rowcount', -1)
+            if rowcount and rowcount > 0:
+                self.rows += rowcount
+
+    def __enter__(self):
+        self.wrapper = connections[router.db_for_write(self.model)].execute_wrapper(self)
+        self.wrapper.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        self.wrapper.__exit__(exc_type, exc_value, traceback)
+        self.collector.record(Measurement(
+            self.operation, self.model._meta.label, duration, self.queries, self.rows, exc_type is not None
+        ))
+        return False
+
+
+def measured(operation, get_model=type):
+    """
+    Decorator measuring the calls of a function or method if a collector is set.
+    ``get_model`` gets the edit suggestion model from the first argument, its class by default
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(obj, *args, **kwargs):
+            collector = _collector
+            if collector is None:
+                return func(obj, *args, **kwargs)
+            with Measure(operation, get_model(obj), collector):
+                return func(obj, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(math.ceil(percent / 100.0 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class InMemoryCollector(object):
+    """
+    Aggregates the measurements by (operation, model). Durations and query counts of the last ``sample_size``
+    calls are kept for the percentiles, counts and totals cover every call. Thread safe.
+    """
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+    def record(self, measurement):
+        key = (measurement.operation, measurement.model)
+        with self.lock:
+            operation = self.operations.get(key)
+            if operation is None:
+                operation = self.operations[key] = {
+                    'count': 0,
+                    'errors': 0,
+                    'time': 0.0,
+                    'queries': 0,
+                    'rows': 0,
+                    'durations': collections.deque(maxlen=self.sample_size),
+                    'query_counts': collections.deque(maxlen=self.sample_size),
+                }
+            operation['count'] += 1
+            operation['errors'] += measurement.error
+            operation['time'] += measurement.duration
+            operation['queries'] += measurement.queries
+            operation['rows'] += measurement.rows
+            operation['durations'].append(measurement.duration)
+            operation['query_counts'].append(measurement.queries)
+
+    def stats(self):
+        """
+        (operation, model label) -> count, errors, total time, queries and rows,
+        and the p50/p90/p99/max of the duration (seconds) and of the number of queries
+        """
+        with self.lock:
+            operations = {key: dict(value, durations=sorted(value['durations']),
+                                    query_counts=sorted(value['query_counts']))
+                          for key, value in self.operations.items()}
+        stats = {}
+        for key, operation in operations.items():
+            durations = operation.pop('durations')
+            query_counts = operation.pop('query_counts')
+            for name, values in (('duration', durations), ('queries', query_counts)):
+                for percent in (50, 90, 99):
+                    operation[f'{name}_p{percent}'] = percentile(values, percent)
+                operation[f'{name}_max'] = values[-1]
+            stats[key] = operation
+        return stats
@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.core.management.base import CommandError
+
+
+def get_edit_suggestions(labels=None):
+    """
+    Returns the EditSuggestion of the parent models: all of them or the ones of the app_label.ModelName labels
+    """
+    if labels:
+        try:
+            parent_models = [apps.get_model(label) for label in labels]
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+    else:
+        parent_models = apps.get_models()
+    edit_suggestions = []
+    for model in parent_models:
+        manager_name = getattr(model._meta, 'edit_suggestion_manager_attribute', None)
+        if manager_name is None:
+            if labels:
+                raise CommandError(f'{model._meta.label} has no edit suggestions')
+            continue
+        edit_suggestions.append(getattr(model, manager_name).model._meta.edit_suggestion)
+    return edit_suggestions
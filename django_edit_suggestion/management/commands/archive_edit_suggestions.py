@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ._utils import get_edit_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Moves the resolved edit suggestions older than a number of days to the archive tables, or deletes them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='parent models as app_label.ModelName, all by default')
+        parser.add_argument('--days', type=int, default=90,
+                            help='resolved edit suggestions not updated for this number of days (default: 90)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='edit suggestions by transaction')
+        parser.add_argument('--purge', action='store_true', help='delete them instead of archiving')
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(days=options['days'])
+        for edit_suggestion in get_edit_suggestions(options['models']):
+            if not edit_suggestion.archive and not options['purge']:
+                if options['models']:
+                    raise CommandError(f'{edit_suggestion.parent_model._meta.label} does not use archive')
+                continue
+            count = edit_suggestion.archive_resolved(older_than, chunk_size=options['chunk_size'],
+                                                     purge=options['purge'])
+            action = 'deleted' if options['purge'] else 'archived'
+            self.stdout.write(f'{edit_suggestion.parent_model._meta.label}: {count} {action}')
@@ -0,0 +1,75 @@
+import gzip
+import io
+import itertools
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ._utils import get_edit_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Exports the edit suggestions as JSON Lines, one edit suggestion by line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='parent models as app_label.ModelName, all by default')
+        parser.add_argument('--output', '-o', help='file to write to, stdout by default. compressed if it ends with .gz')
+        parser.add_argument('--gzip', action='store_true', help='compress the output')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='edit suggestions loaded at once')
+        parser.add_argument('--after-pk', type=int,
+                            help='export only the edit suggestions with a greater primary key, to resume an export')
+
+    def handle(self, *args, **options):
+        edit_suggestions = get_edit_suggestions(options['models'])
+        if options['after_pk'] is not None and len(edit_suggestions) != 1:
+            raise CommandError('--after-pk needs a single model')
+        compress = options['gzip'] or (options['output'] or '').endswith('.gz')
+        if options['output']:
+            stream = gzip.open(options['output'], 'wt') if compress else open(options['output'], 'w')
+        elif compress:
+            stream = io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb'))
+        else:
+            stream = self.stdout
+        try:
+            for edit_suggestion in edit_suggestions:
+                count, last_pk = self.export(edit_suggestion, stream, options['chunk_size'], options['after_pk'])
+                self.stderr.write(f'{edit_suggestion.parent_model._meta.label}: {count} exported, last pk {last_pk}')
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+
+    def export(self, edit_suggestion, stream, chunk_size, after_pk):
+        model = edit_suggestion.edit_suggestion_model
+        label = edit_suggestion.parent_model._meta.label
+        queryset = model.objects.order_by('pk')
+        if after_pk is not None:
+            queryset = queryset.filter(pk__gt=after_pk)
+        if edit_suggestion.sparse_storage:
+            # the values not stored are read from the parent
+            queryset = queryset.select_related('edit_suggestion_parent')
+        rows = queryset.iterator(chunk_size=chunk_size)
+        count = 0
+        last_pk = after_pk
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return count, last_pk
+            # tracked fields with the m2m ids of the whole chunk, one query for each m2m field
+            snapshots = edit_suggestion.snapshots(model, chunk)
+            for instance in chunk:
+                stream.write(json.dumps({
+                    'model': label,
+                    'id': instance.pk,
+                    'parent_id': instance.edit_suggestion_parent_id,
+                    'author_id': instance.edit_suggestion_author_id,
+                    'status': instance.edit_suggestion_status,
+                    'reason': instance.edit_suggestion_reason,
+                    'reject_reason': instance.edit_suggestion_reject_reason,
+                    'date_created': instance.edit_suggestion_date_created,
+                    'date_updated': instance.edit_suggestion_date_updated,
+                    'fields': snapshots[instance.pk],
+                }, cls=DjangoJSONEncoder) + '\n')
+            count += len(chunk)
+            last_pk = chunk[-1].pk
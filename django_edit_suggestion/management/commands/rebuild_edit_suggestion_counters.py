@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ._utils import get_edit_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the counters of the edit suggestions using the status_counters option'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='parent models as app_label.ModelName, all by default')
+
+    def handle(self, *args, **options):
+        for edit_suggestion in get_edit_suggestions(options['models']):
+            if not edit_suggestion.status_counters:
+                if options['models']:
+                    raise CommandError(f'{edit_suggestion.parent_model._meta.label} does not use status_counters')
+                continue
+            count = edit_suggestion.rebuild_counters()
+            self.stdout.write(f'{edit_suggestion.parent_model._meta.label}: {count} counters')
@@ -1,17 +1,33 @@
 from __future__ import unicode_literals
 
-from django.db import models
+import itertools
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import RowNumber
+
+from .context import get_current_user
+from .exceptions import EditSuggestionDuplicateError
+from .instrumentation import measured
 
 
 class EditSuggestionDescriptor(object):
 
-    def __init__(self, model):
+    def __init__(self, model, name):
         self.model = model
+        self.name = name
+        self.manager = EditSuggestionManager(model)
 
     def __get__(self, instance, owner):
         if instance is None:
-            return EditSuggestionManager(self.model)
-        return EditSuggestionManager(self.model, instance)
+            return self.manager
+        # cache the manager on the instance. being a non data descriptor, the instance attribute is used afterwards
+        manager = EditSuggestionManager(self.model, instance)
+        instance.__dict__[self.name] = manager
+        return manager
 
 
 class EditSuggestionManager(models.Manager):
@@ -20,6 +36,12 @@ class EditSuggestionManager(models.Manager):
         super(EditSuggestionManager, self).__init__()
         self.model = model
         self.instance = instance
+        self._pending_count = None  # (generation, count)
+
+    def __reduce__(self):
+        # the edit suggestion model can't always be pickled by reference, rebuild the manager from the parent model
+        edit_suggestion = self.model._meta.edit_suggestion
+        return rebuild_manager, (edit_suggestion.parent_model, edit_suggestion.manager_name, self.instance)
 
     def get_super_queryset(self):
         return super(EditSuggestionManager, self).get_queryset()
@@ -28,11 +50,272 @@ class EditSuggestionManager(models.Manager):
         qs = self.get_super_queryset()
         if self.instance is None:
             return qs
-        return self.get_super_queryset().filter(**{'edit_suggestion_parent': self.instance})
+        try:
+            # set by prefetch_edit_suggestions
+            return self.instance._prefetched_objects_cache[self.model._meta.edit_suggestion.manager_name]
+        except (AttributeError, KeyError):
+            pass
+        return self.get_unprefetched_queryset()
 
-    def new(self, data):
+    @measured('new', lambda manager: manager.model)
+    def new(self, data, m2m_data=None):
+        """
+        Creates an edit suggestion of the parent. ``m2m_data`` is a dict of m2m field name -> list of pks
+        (list of dicts with 'pk' and the extra fields for through), like bulk_new.
+        With the ``deduplicate`` option an identical edit suggestion under review may be returned instead
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
         data['edit_suggestion_parent'] = self.instance
-        return self.create(**data)
+        if 'edit_suggestion_author' not in data and 'edit_suggestion_author_id' not in data:
+            # the user of the current request, when the middleware is used
+            data['edit_suggestion_author'] = get_current_user()
+        if 'edit_suggestion_content_hash' not in data:
+            duplicate = self.check_duplicate(data, m2m_data)
+            if duplicate is not None:
+                return duplicate
+        if hasattr(self.instance, '_prefetched_objects_cache'):
+            self.instance._prefetched_objects_cache.pop(edit_suggestion.manager_name, None)
+        content_hash = data.get('edit_suggestion_content_hash')
+        if not m2m_data and not content_hash:
+            return self.create(**data)
+        using = router.db_for_write(self.model)
+        try:
+            # a savepoint, so a concurrent duplicate doesn't break the outer transaction
+            with transaction.atomic(using=using):
+                instance = self.create(**data)
+                for m2m_field in edit_suggestion.tracked_fields['m2m']:
+                    edit_suggestion.bulk_insert_m2m(m2m_field, [(instance, m2m_data or {})], using)
+        except IntegrityError:
+            # created by a concurrent request since check_duplicate, see the deduplicate constraint
+            duplicate = edit_suggestion.get_duplicate(self.instance, content_hash) if content_hash else None
+            if duplicate is None:
+                raise
+            return self.resolve_duplicate(duplicate)
+        return instance
+
+    def check_duplicate(self, data, m2m_data=None):
+        """
+        With the ``deduplicate`` option, sets the content hash in ``data`` and returns the edit suggestion under review
+        of the parent having the same content (raises EditSuggestionDuplicateError for 'reject'), None if there's none.
+        Edit suggestions of models with m2m fields are only deduplicated when ``m2m_data`` is given
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
+        if not edit_suggestion.deduplicate:
+            return None
+        content_hash = edit_suggestion.content_hash(self.model(**data), m2m_data)
+        if content_hash is None:
+            return None
+        duplicate = edit_suggestion.get_duplicate(self.instance, content_hash)
+        if duplicate is None:
+            data['edit_suggestion_content_hash'] = content_hash
+            return None
+        return self.resolve_duplicate(duplicate)
+
+    def resolve_duplicate(self, duplicate):
+        """Raises EditSuggestionDuplicateError for 'reject', returns the duplicate marked as merged for 'merge'"""
+        if self.model._meta.edit_suggestion.deduplicate == 'reject':
+            raise EditSuggestionDuplicateError(
+                'An identical edit suggestion is already under review', duplicate
+            )
+        duplicate.edit_suggestion_merged = True
+        return duplicate
+
+    async def anew(self, data, m2m_data=None):
+        return await sync_to_async(self.new)(data, m2m_data)
+
+    def __aiter__(self):
+        return self.aiterator()
+
+    async def aiterator(self, chunk_size=100):
+        """
+        Iterates asynchronously the edit suggestions, loaded ``chunk_size`` at a time.
+        django 3.1 has no async orm so each chunk is loaded in one thread hop
+        """
+        rows = self.get_queryset().iterator(chunk_size=chunk_size)
+        load_chunk = sync_to_async(lambda: list(itertools.islice(rows, chunk_size)))
+        while True:
+            chunk = await load_chunk()
+            if not chunk:
+                return
+            for instance in chunk:
+                yield instance
+
+    def pending_count(self):
+        """
+        Number of edit suggestions under review.
+        Memoized until the edit suggestions change if the ``memoize_counts`` option is set
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
+        if edit_suggestion.status_counters and self.instance is not None:
+            return self.pending_counts([self.instance])[self.instance.pk]
+        if not edit_suggestion.memoize_counts:
+            return self.filter(edit_suggestion_status=edit_suggestion.Status.UNDER_REVIEWS).count()
+        if self._pending_count is None or self._pending_count[0] != edit_suggestion.generation:
+            generation = edit_suggestion.generation
+            count = self.filter(edit_suggestion_status=edit_suggestion.Status.UNDER_REVIEWS).count()
+            self._pending_count = (generation, count)
+        return self._pending_count[1]
+
+    def pending_counts(self, parents):
+        """
+        Number of edit suggestions under review of each parent (or parent pk): parent pk -> count, with one query.
+        Read from the counters if the ``status_counters`` option is set
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
+        parent_ids = [getattr(parent, 'pk', parent) for parent in parents]
+        if edit_suggestion.status_counters:
+            rows = edit_suggestion.counter_model.objects.filter(
+                parent_id__in=parent_ids, status=edit_suggestion.Status.UNDER_REVIEWS
+            ).values_list('parent_id', 'count')
+        else:
+            rows = self.get_super_queryset().filter(
+                edit_suggestion_parent_id__in=parent_ids, edit_suggestion_status=edit_suggestion.Status.UNDER_REVIEWS
+            ).order_by().values_list('edit_suggestion_parent_id').annotate(models.Count('pk'))
+        counts = dict.fromkeys(parent_ids, 0)
+        counts.update(rows)
+        return counts
+
+    def status_summary(self, parents, cache_timeout=None):
+        """
+        Number of edit suggestions of each parent (or parent pk) by status: parent pk -> {status: count}, with one
+        GROUP BY query (or read from the counters if the ``status_counters`` option is set).
+        With ``cache_timeout`` (seconds) the summaries are kept in the default cache and reused until they expire,
+        changes to the edit suggestions don't invalidate them.
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
+        parent_ids = [getattr(parent, 'pk', parent) for parent in parents]
+        summary = {}
+        if cache_timeout:
+            keys = {self.summary_cache_key(pk): pk for pk in parent_ids}
+            summary = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+        missing = [pk for pk in parent_ids if pk not in summary]
+        if missing:
+            if edit_suggestion.status_counters:
+                rows = edit_suggestion.counter_model.objects.filter(parent_id__in=missing) \
+                    .values_list('parent_id', 'status', 'count')
+            else:
+                rows = self.get_super_queryset().filter(edit_suggestion_parent_id__in=missing).order_by() \
+                    .values_list('edit_suggestion_parent_id', 'edit_suggestion_status').annotate(models.Count('pk'))
+            computed = {pk: dict.fromkeys(edit_suggestion.Status.values, 0) for pk in missing}
+            for parent_id, status, count in rows:
+                computed[parent_id][status] = count
+            if cache_timeout:
+                cache.set_many({self.summary_cache_key(pk): value for pk, value in computed.items()}, cache_timeout)
+            summary.update(computed)
+        return summary
+
+    def summary_cache_key(self, parent_id):
+        return f'edit_suggestion_summary:{self.model._meta.label_lower}:{parent_id}'
+
+    def applicable(self):
+        """
+        Edit suggestions under review made against the current version of their parent, or made before
+        version_field was set. The versions are compared in the query, the parents are not loaded
+        """
+        edit_suggestion = self.model._meta.edit_suggestion
+        if not edit_suggestion.version_field:
+            raise ImproperlyConfigured('applicable() needs the version_field option of EditSuggestion')
+        return self.filter(
+            models.Q(edit_suggestion_base_version=models.F(f'edit_suggestion_parent__{edit_suggestion.version_field}'))
+            | models.Q(edit_suggestion_base_version__isnull=True),
+            edit_suggestion_status=edit_suggestion.Status.UNDER_REVIEWS,
+        )
+
+    def bulk_new(self, rows, batch_size=500, send_signals=False):
+        return self.model._meta.edit_suggestion.bulk_new(rows, batch_size=batch_size, send_signals=send_signals)
+
+    def publish_many(self, queryset, user):
+        return self.model._meta.edit_suggestion.publish_many(queryset, user)
+
+    def auto_publish(self, queryset, user):
+        return self.model._meta.edit_suggestion.auto_publish(queryset, user)
+
+    def claim(self, user, count=1, lease=None):
+        """Claims the next edit suggestions under review for the user, see EditSuggestion.claim"""
+        edit_suggestion = self.model._meta.edit_suggestion
+        kwargs = {'lease': lease} if lease is not None else {}
+        return edit_suggestion.claim(self.get_unprefetched_queryset(), user, count=count, **kwargs)
+
+    def release(self, user):
+        """Releases the claims of the user"""
+        return self.model._meta.edit_suggestion.release(self.get_unprefetched_queryset(), user)
+
+    def get_unprefetched_queryset(self):
+        qs = self.get_super_queryset()
+        if self.instance is None:
+            return qs
+        return qs.filter(edit_suggestion_parent=self.instance)
+
+    def archive_resolved(self, older_than, chunk_size=1000, purge=False):
+        return self.model._meta.edit_suggestion.archive_resolved(older_than, chunk_size=chunk_size, purge=purge)
+
+    def diff_many(self, queryset=None):
+        """
+        Returns the ``ModelDelta`` of every edit suggestion from the queryset.
+        Parents and m2m fields are prefetched so the number of queries doesn't depend on the number of edit suggestions
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+        m2m_names = [f['name'] for f in self.model.edit_suggestion_tracked_fields['m2m']]
+        queryset = queryset.select_related('edit_suggestion_parent').prefetch_related(
+            *m2m_names, *[f'edit_suggestion_parent__{name}' for name in m2m_names]
+        )
+        return [instance.diff_against_parent() for instance in queryset]
 
     def get_tracked_fields(self):
         return self.model.edit_suggestion_tracked_fields['simple'],  self.model.edit_suggestion_tracked_fields['foreign'], self.model.edit_suggestion_tracked_fields['m2m']
+
+
+def rebuild_manager(parent_model, name, instance):
+    return EditSuggestionManager(getattr(parent_model, name).model, instance)
+
+
+def prefetch_edit_suggestions(parents, status=None, limit_per_parent=None):
+    """
+    Loads the edit suggestions of many parents with one query and caches them on the parents,
+    ``parent.edit_suggestions.all()`` returns them without a query afterwards.
+    ``parents`` is a queryset or a list of parents of the same model. Edit suggestions are filtered by ``status``
+    and at most ``limit_per_parent`` of the newest ones are kept for each parent.
+    Returns the list of parents.
+    """
+    parents = list(parents)
+    if not parents:
+        return parents
+    parent_model = type(parents[0])
+    manager_name = parent_model._meta.edit_suggestion_manager_attribute
+    model = getattr(parent_model, manager_name).model
+    queryset = model._default_manager.filter(edit_suggestion_parent__in=parents)
+    if status is not None:
+        queryset = queryset.filter(edit_suggestion_status=status)
+    ordering = (models.F('edit_suggestion_date_created').desc(), models.F('pk').desc())
+    using = router.db_for_read(model)
+    if limit_per_parent is not None and connections[using].features.supports_over_clause:
+        # window functions can't be filtered by the orm, filter the numbered rows in a subquery
+        numbered = queryset.annotate(
+            es_pk=models.F('pk'),
+            es_row_number=Window(RowNumber(), partition_by=[models.F('edit_suggestion_parent')], order_by=ordering),
+        ).order_by().values('es_pk', 'es_row_number')
+        sql, params = numbered.query.get_compiler(using).as_sql()
+        qn = connections[using].ops.quote_name
+        queryset = model._default_manager.filter(pk__in=RawSQL(
+            'SELECT {pk} FROM ({sql}) es_numbered WHERE {row_number} <= %s'.format(
+                pk=qn('es_pk'), sql=sql, row_number=qn('es_row_number')
+            ),
+            tuple(params) + (limit_per_parent,),
+        ))
+    edit_suggestions = {parent.pk: [] for parent in parents}
+    for instance in queryset.order_by(*ordering):
+        by_parent = edit_suggestions[instance.edit_suggestion_parent_id]
+        if limit_per_parent is None or len(by_parent) < limit_per_parent:
+            by_parent.append(instance)
+    for parent in parents:
+        # same as django does for prefetch_related
+        qs = model._default_manager.filter(edit_suggestion_parent=parent)
+        qs._result_cache = edit_suggestions[parent.pk]
+        qs._prefetch_done = True
+        for instance in qs._result_cache:
+            instance.edit_suggestion_parent = parent
+        if not hasattr(parent, '_prefetched_objects_cache'):
+            parent._prefetched_objects_cache = {}
+        parent._prefetched_objects_cache[manager_name] = qs
+    return parents
@@ -1,20 +1,37 @@
-from django.utils.deprecation import MiddlewareMixin
+import asyncio
 
-from .models import EditSuggestion
+from .context import current_request
 
 
-class EditSuggestionRequestMiddleware(MiddlewareMixin):
+class EditSuggestionRequestMiddleware(object):
     """Expose request to EditableSuggestion.
 
-    This middleware sets request as a local thread variable, making it
+    This middleware sets request in a context variable, making it
     available to the model-level utilities to allow tracking of the
-    authenticated user making a change.
+    authenticated user making a change (see ``context.get_current_user``).
+    It works in sync and async mode without switching threads.
     """
+    sync_capable = True
+    async_capable = True
 
-    def process_request(self, request):
-        EditSuggestion.thread.request = request
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # mark the instance as a coroutine function so django calls it in async mode, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
-    def process_response(self, request, response):
-        if hasattr(EditSuggestion.thread, "request"):
-            del EditSuggestion.thread.request
-        return response
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
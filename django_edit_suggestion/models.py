@@ -1,35 +1,53 @@
 from __future__ import unicode_literals
 
+import contextlib
 import copy
+import datetime
+import hashlib
 import importlib
-import threading
+import itertools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 
 import six
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models, router, transaction
+from django.db.models.deletion import Collector
 from django.db.models.fields.proxy import OrderWrt
 from django.db.models.fields.files import FileField
-from django.forms.models import model_to_dict
+from django.utils import timezone
 from django.utils.text import format_lazy
 from django.utils.encoding import smart_str
 from . import exceptions
+from .context import RequestHolder
+from .instrumentation import measured
 from .manager import EditSuggestionDescriptor
 from django.contrib.auth.models import PermissionDenied
 from django.db.models.fields.related import ForeignKey
 
 registered_models = {}
+logger = logging.getLogger(__name__)
+default_hook_executor = None
 
 
 class EditSuggestion(object):
-    thread = threading.local()
+    # kept for compatibility, the request is in a context variable (see context.get_current_request)
+    thread = RequestHolder()
 
     class Status(models.IntegerChoices):
         UNDER_REVIEWS = (0, 'under review')
         PUBLISHED = (1, 'published')
         REJECTED = (2, 'rejected')
+        SUPERSEDED = (3, 'superseded')
+
+    SUPERSEDE_REASON = 'Superseded by a published edit suggestion'
 
     def __init__(
             self,
@@ -50,7 +68,33 @@ class EditSuggestion(object):
             app=None,
             related_name=None,
             signals=None,
-            attrs_to_be_copied=None
+            attrs_to_be_copied=None,
+            memoize_counts=False,
+            # keep only the changed simple/foreign fields in a json column instead of copying the whole row
+            sparse_storage=False,
+            # Meta.indexes of the edit suggestion model, None for the default ones (see get_indexes)
+            indexes=None,
+            # what happens to the other edit suggestions under review of the parent after a publish.
+            # None leaves them as they are, 'supersede' sets them superseded and 'reject' rejects them
+            on_publish_supersede=None,
+            # integer field of the parent bumped on every save. edit suggestions made against an older version
+            # of the parent can't be published
+            version_field=None,
+            # store a snapshot of the parent on creation and publish only the fields the edit suggestion changed
+            three_way_merge=False,
+            # keep the number of edit suggestions of each parent by status in a side table
+            status_counters=False,
+            # create an archive model where resolved edit suggestions can be moved to
+            archive=False,
+            # run post_publish and post_reject after the transaction commits, in hook_executor
+            defer_hooks=False,
+            # object with a concurrent.futures.Executor like submit(fn, *args) method. a thread pool by default
+            hook_executor=None,
+            # edit suggestions can be claimed by moderators for a time (manager claim method)
+            review_queue=False,
+            # what happens to an edit suggestion identical to one under review of the same parent.
+            # None creates it, 'reject' raises EditSuggestionDuplicateError and 'merge' returns the existing one
+            deduplicate=None,
     ):
         self.change_status_condition = change_status_condition
         self.post_publish = post_publish
@@ -63,11 +107,44 @@ class EditSuggestion(object):
         self.custom_model_name = custom_model_name
         self.app = app
         self.related_name = related_name
-        self.excluded_fields = excluded_fields if excluded_fields else []
+        self.excluded_fields = list(excluded_fields) if excluded_fields else []
+        self.version_field = version_field
+        if version_field and version_field not in self.excluded_fields:
+            # the version is handled separately, it's not an editable field
+            self.excluded_fields.append(version_field)
         self.edit_suggestion_model = None  # will be declared in finalize method
         self.tracked_fields = {'simple': [], 'foreign': [], 'm2m': []}  # filled up in set_tracked_fields method
+        self.tracked_attnames = {}  # field name -> attribute name, filled up in set_tracked_fields method
+        self.through_fields = {}  # m2m field name -> copied through attribute names, filled up in clone_pivot_table
         self.signals = signals
         self.attrs_to_be_copied = attrs_to_be_copied if attrs_to_be_copied else []
+        self.memoize_counts = memoize_counts
+        self.sparse_storage = sparse_storage
+        self.indexes = indexes
+        if on_publish_supersede not in (None, 'supersede', 'reject'):
+            raise ValueError(
+                "The 'on_publish_supersede' option must be None, 'supersede' or 'reject', not '{}'".format(
+                    on_publish_supersede
+                )
+            )
+        self.on_publish_supersede = on_publish_supersede
+        self.three_way_merge = three_way_merge
+        self.status_counters = status_counters
+        self.counter_model = None  # will be declared in finalize method
+        self.archive = archive
+        self.archive_model = None  # will be declared in finalize method
+        self.defer_hooks = defer_hooks
+        self.hook_executor = hook_executor
+        self.review_queue = review_queue
+        if deduplicate not in (None, 'reject', 'merge'):
+            raise ValueError(
+                "The 'deduplicate' option must be None, 'reject' or 'merge', not '{}'".format(deduplicate)
+            )
+        self.deduplicate = deduplicate
+        self.sparse_fields = {}  # attribute name -> copied field, filled up in get_sparse_fields
+        # changes every time edit suggestions are written. used to invalidate memoized counts
+        self._generations = itertools.count()
+        self.generation = next(self._generations)
         try:
             if isinstance(bases, six.string_types):
                 raise TypeError
@@ -104,10 +181,21 @@ class EditSuggestion(object):
         self.edit_suggestion_model = self.create_edit_suggestion_model(sender)
         module = importlib.import_module(self.module)
         setattr(module, self.edit_suggestion_model.__name__, self.edit_suggestion_model)
-        descriptor = EditSuggestionDescriptor(self.edit_suggestion_model)
+        descriptor = EditSuggestionDescriptor(self.edit_suggestion_model, self.manager_name)
         setattr(sender, self.manager_name, descriptor)
         sender._meta.edit_suggestion_manager_attribute = self.manager_name
         models.signals.pre_save.connect(self.pre_save_edit_suggestion, self.edit_suggestion_model, weak=False)
+        if self.version_field:
+            models.signals.pre_save.connect(self.pre_save_parent, sender, weak=False)
+            models.signals.post_save.connect(self.post_save_parent, sender, weak=False)
+        if self.status_counters:
+            self.counter_model = self.create_counter_model(sender)
+            setattr(module, self.counter_model.__name__, self.counter_model)
+            models.signals.post_save.connect(self.post_save_counters, self.edit_suggestion_model, weak=False)
+            models.signals.post_delete.connect(self.post_delete_counters, self.edit_suggestion_model, weak=False)
+        if self.archive:
+            self.archive_model = self.create_archive_model(sender)
+            setattr(module, self.archive_model.__name__, self.archive_model)
         # set up custom parent model signals
         if self.signals:
             for signal_name, signal_handlers in self.signals.items():
@@ -150,11 +238,13 @@ class EditSuggestion(object):
                 self.tracked_fields['foreign'].append(field_name)
             else :
                 self.tracked_fields['simple'].append(field_name)
+            self.tracked_attnames[field_name] = field.get_attname()
 
     def create_edit_suggestion_model(self, model):
         """
         Creates an editable suggestion model to associate with the model provided.
         """
+        self.parent_model = model
         attrs = {
             "__module__": self.module,
             "_edit_suggestion_excluded_fields": self.excluded_fields,
@@ -173,6 +263,11 @@ class EditSuggestion(object):
 
         fields = {**self.copy_fields(model), **self.copy_m2m_fields(model)}
         self.set_tracked_fields(fields)
+        if self.sparse_storage:
+            sparse_fields = self.tracked_fields['simple'] + self.tracked_fields['foreign']
+            for name in sparse_fields:
+                del fields[name]
+            attrs.update(self.get_sparse_fields(model, sparse_fields))
         attrs.update(fields)
         attrs.update(self.get_extra_fields(model, fields))
         # type in python2 wants str as a first argument
@@ -183,8 +278,58 @@ class EditSuggestion(object):
 
         registered_models[model._meta.db_table] = model
         edit_suggestion_model = type(str(name), self.bases, attrs)
+        # keep a reference to the configuration for the manager level (bulk) operations
+        edit_suggestion_model._meta.edit_suggestion = self
         return edit_suggestion_model
 
+    def create_counter_model(self, model):
+        """
+        Creates the model keeping the number of edit suggestions of each parent by status.
+        """
+        meta_fields = {"unique_together": (("parent", "status"),)}
+        if self.app:
+            meta_fields["app_label"] = self.app
+        attrs = {
+            "__module__": self.edit_suggestion_model.__module__,
+            "parent": models.ForeignKey(model, on_delete=models.CASCADE, related_name="+"),
+            "status": models.IntegerField(choices=self.Status.choices),
+            "count": models.IntegerField(default=0),
+            "Meta": type(str("Meta"), (), meta_fields),
+        }
+        name = "{}Counter".format(self.edit_suggestion_model.__name__)
+        return type(str(name), (models.Model,), attrs)
+
+    def create_archive_model(self, model):
+        """
+        Creates the model the resolved edit suggestions are archived to.
+        The tracked fields, m2m included, are kept in a json field.
+        """
+        meta_fields = {
+            "ordering": ("-edit_suggestion_date_created",),
+            "verbose_name": format_lazy("archived edit suggestion {}", smart_str(model._meta.verbose_name)),
+        }
+        if self.app:
+            meta_fields["app_label"] = self.app
+        attrs = {
+            "__module__": self.edit_suggestion_model.__module__,
+            # primary key of the archived edit suggestion
+            "edit_suggestion_id": models.IntegerField(db_index=True),
+            "edit_suggestion_author": models.ForeignKey(get_user_model(), null=True, blank=True,
+                                                        on_delete=models.DO_NOTHING, db_constraint=False,
+                                                        related_name="+"),
+            "edit_suggestion_parent": models.ForeignKey(model, on_delete=models.CASCADE, related_name="+"),
+            "edit_suggestion_date_created": models.DateTimeField(),
+            "edit_suggestion_date_updated": models.DateTimeField(),
+            "edit_suggestion_date_archived": models.DateTimeField(auto_now_add=True),
+            "edit_suggestion_reason": models.TextField(),
+            "edit_suggestion_status": models.IntegerField(choices=self.Status.choices),
+            "edit_suggestion_reject_reason": models.TextField(),
+            "edit_suggestion_data": models.JSONField(encoder=DjangoJSONEncoder),
+            "Meta": type(str("Meta"), (), meta_fields),
+        }
+        name = "{}Archive".format(self.edit_suggestion_model.__name__)
+        return type(str(name), (models.Model,), attrs)
+
     def fields_included(self, model):
         fields = []
         for field in model._meta.fields:
@@ -282,6 +427,10 @@ class EditSuggestion(object):
 
         fields = self.copy_fields(m2m_field['through']['model'])
         del fields['id']
+        # supplementary fields of the through model that get copied on publish
+        self.through_fields[m2m_field['name']] = [
+            f.get_attname() for name, f in fields.items() if name != m2m_field['through']['self_field']
+        ]
         # add parent and relation fields
         field_args = dict(
             db_constraint=False,
@@ -310,59 +459,73 @@ class EditSuggestion(object):
         def str_repr(instance):
             return f'Edit Suggestion by {instance.edit_suggestion_author} for "{instance.edit_suggestion_parent}"'
 
+        @measured('publish')
         def publish(instance, user):
             # instance is the current edit suggestion
             if not self.change_status_condition(instance, user):
                 raise PermissionDenied('User not allowed to publish the edit suggestion')
-            for updatable_field in self.tracked_fields['simple']:
-                setattr(instance.edit_suggestion_parent, updatable_field, getattr(instance, updatable_field))
-            for updatable_field in self.tracked_fields['foreign']:
-                setattr(instance.edit_suggestion_parent, updatable_field, getattr(instance, updatable_field))
-            # set m2m fields
-            for m2m_field in self.tracked_fields['m2m']:
-                parent_m2m_field = getattr(instance.edit_suggestion_parent, m2m_field['name'])
-                instance_m2m_field = getattr(instance, m2m_field['name'])
-                if 'through' in m2m_field:
-                    filter_dict = {}
-                    filter_dict[m2m_field['through']['self_field']] = instance.edit_suggestion_parent
-                    # need to filter manually
-
-                    # clear the parent through records
-                    parent_m2m_field.through.objects.filter(**filter_dict).all().delete()
-
-                    # get supplimentary fields of through model
-                    through_fields = []
-                    for through_field in instance_m2m_field.through._meta.fields:
-                        if through_field.name not in ['id', m2m_field['through']['self_field']]:
-                            through_fields.append(through_field.name)
-
-                    # need to filter manually
-                    filter_dict[m2m_field['through']['self_field']] = instance
-                    all_edit_through_children = instance_m2m_field.through.objects.filter(**filter_dict).all()
-
-                    # copy child data of edit suggestion to parent by creating new children
-                    for child in all_edit_through_children:
-                        data = {
-                            m2m_field['through']['self_field']: instance.edit_suggestion_parent
-                        }
-                        # populate extra through fields
-                        for f in through_fields:
-                            data[f] = getattr(child, f)
-                        parent_m2m_field.through.objects.create(**data)
+            with self.lock_for_update(instance):
+                if self.three_way_merge:
+                    changes, conflicts = instance.get_merge()
+                    if conflicts:
+                        raise exceptions.EditSuggestionConflictError(
+                            'Fields changed since the edit suggestion was made: {}'.format(', '.join(conflicts)),
+                            conflicts
+                        )
                 else:
-                    parent_m2m_field.set(instance_m2m_field.all())
-            instance.edit_suggestion_parent.save()
-            instance.edit_suggestion_status = self.Status.PUBLISHED
-            instance.save()
-            self.post_publish(instance, user) if self.post_publish else None
+                    self.check_version(instance)
+                    # write only what is different from the parent
+                    changes = instance.get_parent_changes()
+                parent = instance.edit_suggestion_parent
+                update_fields = []
+                if self.version_field and changes:
+                    # pre_save_parent bumps it
+                    update_fields.append(self.version_field)
+                for updatable_field in self.tracked_fields['simple'] + self.tracked_fields['foreign']:
+                    if updatable_field in changes:
+                        setattr(parent, self.tracked_attnames[updatable_field], changes[updatable_field])
+                        update_fields.append(updatable_field)
+                # set m2m fields
+                for m2m_field in self.tracked_fields['m2m']:
+                    if m2m_field['name'] not in changes:
+                        continue
+                    parent_m2m_field = getattr(parent, m2m_field['name'])
+                    if 'through' in m2m_field:
+                        self_field = m2m_field['through']['self_field']
+                        through_fields = self.through_fields[m2m_field['name']]
+                        # clear the parent through records
+                        parent_m2m_field.through.objects.filter(**{self_field: parent}).delete()
+                        # copy child data of edit suggestion to parent by creating new children
+                        parent_m2m_field.through.objects.bulk_create([
+                            parent_m2m_field.through(**{self_field: parent}, **dict(zip(through_fields, child)))
+                            for child in changes[m2m_field['name']]
+                        ])
+                    else:
+                        parent_m2m_field.set(list(changes[m2m_field['name']]))
+                if update_fields:
+                    parent.save(update_fields=update_fields)
+                instance.edit_suggestion_status = self.Status.PUBLISHED
+                instance.save()
+                if self.on_publish_supersede:
+                    self.supersede_siblings([instance])
+            self.dispatch_hooks(self.post_publish, [(instance, user)])
 
+        @measured('reject')
         def reject(instance, user, reason):
             if not self.change_status_condition(instance, user):
                 raise PermissionDenied('User not allowed to reject the edit suggestion')
-            instance.edit_suggestion_status = self.Status.REJECTED
-            instance.edit_suggestion_reject_reason = reason
-            instance.save()
-            self.post_reject(instance, user, reason) if self.post_reject else None
+            with self.lock_for_update(instance):
+                instance.edit_suggestion_status = self.Status.REJECTED
+                instance.edit_suggestion_reject_reason = reason
+                instance.save()
+            self.dispatch_hooks(self.post_reject, [(instance, user, reason)])
+
+        # django 3.1 has no async orm, the whole operation runs in one thread hop
+        async def apublish(instance, user):
+            return await sync_to_async(publish)(instance, user)
+
+        async def areject(instance, user, reason):
+            return await sync_to_async(reject)(instance, user, reason)
 
         extra_fields = {
             "id": models.AutoField(primary_key=True),
@@ -379,12 +542,62 @@ class EditSuggestion(object):
             "edit_suggestion_reject_reason": models.TextField(),
             "edit_suggestion_publish": publish,
             "edit_suggestion_reject": reject,
+            "edit_suggestion_apublish": apublish,
+            "edit_suggestion_areject": areject,
             "__str__": str_repr,
             "edit_suggestion_tracked_fields": self.tracked_fields,
         }
+        if self.version_field:
+            # version of the parent the edit suggestion was made against
+            extra_fields["edit_suggestion_base_version"] = models.IntegerField(null=True, blank=True, editable=False)
+        if self.review_queue:
+            # moderator working on the edit suggestion and until when
+            extra_fields["edit_suggestion_claimed_by"] = models.ForeignKey(
+                get_user_model(), null=True, blank=True, on_delete=models.SET_NULL,
+                related_name=self.get_related_name_for("claimed_edit_suggestions")
+            )
+            extra_fields["edit_suggestion_claimed_until"] = models.DateTimeField(null=True, blank=True)
+        if self.deduplicate:
+            # hash of the tracked values on creation, see content_hash
+            extra_fields["edit_suggestion_content_hash"] = models.CharField(max_length=64, null=True, blank=True,
+                                                                            db_index=True, editable=False)
+        if self.three_way_merge:
+            # snapshot of the tracked fields of the parent the edit suggestion was made against
+            extra_fields["edit_suggestion_base"] = models.JSONField(null=True, blank=True, editable=False,
+                                                                    encoder=DjangoJSONEncoder)
 
         return extra_fields
 
+    def get_sparse_fields(self, model, names):
+        """
+        Returns the json field keeping the changed values and the properties replacing the tracked fields.
+        Values not in the json field are read from the parent.
+        """
+        attrs = {
+            "edit_suggestion_delta": models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder),
+        }
+        for name in names:
+            # the parent field is used for converting the stored values
+            field = model._meta.get_field(name)
+            attname = field.get_attname()
+            self.sparse_fields[attname] = field
+            attrs[attname] = property(*sparse_value_accessors(attname, field))
+            if attname != name:
+                # foreign field, the related object is got from the stored id
+                attrs[name] = property(*sparse_related_accessors(name, attname, field))
+        return attrs
+
+    def prune_sparse_delta(self, instance):
+        """Removes the values that are the same as the parent ones from the sparse storage"""
+        delta = instance.edit_suggestion_delta
+        if not delta:
+            return
+        parent = instance.edit_suggestion_parent
+        for attname in list(delta):
+            field = self.sparse_fields.get(attname)
+            if field is None or field.to_python(delta[attname]) == getattr(parent, attname):
+                del delta[attname]
+
     def get_related_name_for(self, name):
         return f'{name}_{self.parent_model_name}'
 
@@ -402,18 +615,816 @@ class EditSuggestion(object):
         else:
             name = format_lazy("edit suggestion {}", smart_str(model._meta.verbose_name))
         meta_fields["verbose_name"] = name
+        meta_fields["indexes"] = self.get_indexes(model)
+        if self.deduplicate:
+            digest = hashlib.md5(model._meta.db_table.encode()).hexdigest()[:10]
+            # one edit suggestion under review by content for a parent, even with concurrent requests.
+            # skipped by the backends without partial indexes
+            meta_fields["constraints"] = [
+                models.UniqueConstraint(
+                    fields=['edit_suggestion_parent', 'edit_suggestion_content_hash'],
+                    condition=models.Q(edit_suggestion_status=self.Status.UNDER_REVIEWS),
+                    name=f'es_{digest}_dedup',
+                ),
+            ]
         if self.app:
             meta_fields["app_label"] = self.app
         return meta_fields
 
+    def get_indexes(self, model):
+        """
+        Returns the indexes of the edit suggestion model.
+        By default one for the suggestions of a parent filtered by status, newest first
+        and a partial one for all the suggestions under review, newest first.
+        Partial indexes are skipped by the backends that don't support them.
+        """
+        if self.indexes is not None:
+            # every model needs its own instances, django sets the name of unnamed indexes on them
+            return [index.clone() for index in self.indexes]
+        # conditional indexes must be named, keep it unique and under 30 chars
+        digest = hashlib.md5(model._meta.db_table.encode()).hexdigest()[:10]
+        return [
+            models.Index(fields=[
+                'edit_suggestion_parent',
+                'edit_suggestion_status',
+                '-edit_suggestion_date_created',
+            ]),
+            models.Index(
+                fields=['-edit_suggestion_date_created'],
+                condition=models.Q(edit_suggestion_status=self.Status.UNDER_REVIEWS),
+                name=f'es_{digest}_pending',
+            ),
+        ]
+
+    @contextlib.contextmanager
+    def lock_for_update(self, instance):
+        """
+        Publish/reject block, in a transaction. Holds the row locks of the parent and the edit suggestion when the
+        database supports it, the parent is then reloaded. The status is checked again once locked.
+        """
+        using = router.db_for_write(self.edit_suggestion_model, instance=instance)
+        if not connections[using].features.has_select_for_update:
+            with transaction.atomic(using=using):
+                # no row locks (sqlite): an UPDATE on the edit suggestion if still under review takes the write lock
+                # and checks the status in one query, a stale instance can't overwrite a resolved edit suggestion
+                updated = self.edit_suggestion_model.objects.using(using) \
+                    .filter(pk=instance.pk, edit_suggestion_status=self.Status.UNDER_REVIEWS) \
+                    .update(edit_suggestion_status=models.F('edit_suggestion_status'))
+                if not updated:
+                    raise PermissionDenied('Edit suggestion cannot be modified once the status changed')
+                instance._edit_suggestion_db_status = self.Status.UNDER_REVIEWS
+                yield
+            return
+        with transaction.atomic(using=using):
+            # the parent first, then its edit suggestions, same order everywhere (publish_many, supersede_siblings)
+            parent = self.parent_model._default_manager.using(using).select_for_update() \
+                .get(pk=instance.edit_suggestion_parent_id)
+            status = self.edit_suggestion_model.objects.using(using).select_for_update() \
+                .filter(pk=instance.pk).values_list('edit_suggestion_status', flat=True).first()
+            if status != self.Status.UNDER_REVIEWS:
+                raise PermissionDenied('Edit suggestion cannot be modified once the status changed')
+            instance._edit_suggestion_db_status = status
+            instance.edit_suggestion_parent = parent
+            yield
+
+    def claim(self, queryset, user, count=1, lease=datetime.timedelta(minutes=15)):
+        """
+        Claims for the user the next ``count`` edit suggestions under review of the queryset, oldest first,
+        that aren't claimed or whose claim expired. The rows locked by other moderators are skipped
+        when the database supports ``SELECT ... FOR UPDATE SKIP LOCKED``.
+        Returns the claimed edit suggestions.
+        """
+        if not self.review_queue:
+            raise ImproperlyConfigured('Claiming edit suggestions needs the review_queue option of EditSuggestion')
+        model = self.edit_suggestion_model
+        using = router.db_for_write(model)
+        features = connections[using].features
+        now = timezone.now()
+        claimed_until = now + lease
+        claimable = queryset.using(using).filter(
+            models.Q(edit_suggestion_claimed_until__isnull=True) | models.Q(edit_suggestion_claimed_until__lt=now),
+            edit_suggestion_status=self.Status.UNDER_REVIEWS,
+        )
+        with transaction.atomic(using=using):
+            candidates = claimable.order_by('edit_suggestion_date_created', 'pk')
+            if features.has_select_for_update:
+                candidates = candidates.select_for_update(skip_locked=features.has_select_for_update_skip_locked)
+            pks = list(candidates.values_list('pk', flat=True)[:count])
+            # filtered again so a concurrent claim is not overwritten where rows are not locked
+            claimable.filter(pk__in=pks).update(
+                edit_suggestion_claimed_by=user,
+                edit_suggestion_claimed_until=claimed_until,
+            )
+        return list(model.objects.using(using).filter(
+            pk__in=pks, edit_suggestion_claimed_by=user, edit_suggestion_claimed_until=claimed_until
+        ).order_by('edit_suggestion_date_created', 'pk'))
+
+    def release(self, queryset, user):
+        """Releases the claims of the user on the edit suggestions of the queryset"""
+        return queryset.filter(edit_suggestion_claimed_by=user).update(
+            edit_suggestion_claimed_by=None,
+            edit_suggestion_claimed_until=None,
+        )
+
+    def dispatch_hooks(self, hook, calls):
+        """
+        Calls the hook with each of the args tuples. With ``defer_hooks`` all the calls are sent
+        as a single task to the executor once the current transaction commits.
+        """
+        if not hook or not calls:
+            return
+        if not self.defer_hooks:
+            for args in calls:
+                hook(*args)
+            return
+        executor = self.hook_executor or get_default_hook_executor()
+        transaction.on_commit(
+            lambda: executor.submit(run_hooks, hook, calls),
+            using=router.db_for_write(self.edit_suggestion_model),
+        )
+
+    def suggestions_changed(self):
+        self.generation = next(self._generations)
+
+    def supersede_siblings(self, published):
+        """
+        Moves the other edit suggestions under review of the parents of the published ones
+        to superseded or rejected with a single update. ``post_reject`` isn't called for them.
+        """
+        if self.on_publish_supersede == 'supersede':
+            status = self.Status.SUPERSEDED
+        else:
+            status = self.Status.REJECTED
+        siblings = self.edit_suggestion_model.objects.filter(
+            edit_suggestion_parent_id__in=set(i.edit_suggestion_parent_id for i in published),
+            edit_suggestion_status=self.Status.UNDER_REVIEWS,
+        ).exclude(pk__in=[i.pk for i in published])
+        if self.status_counters:
+            superseded_by_parent = list(
+                siblings.order_by().values_list('edit_suggestion_parent_id').annotate(models.Count('pk'))
+            )
+        superseded = siblings.update(
+            edit_suggestion_status=status,
+            edit_suggestion_reject_reason=self.SUPERSEDE_REASON,
+            edit_suggestion_date_updated=timezone.now(),
+        )
+        if self.status_counters:
+            deltas = {}
+            for parent_id, count in superseded_by_parent:
+                deltas[(parent_id, self.Status.UNDER_REVIEWS)] = -count
+                deltas[(parent_id, status)] = count
+            self.update_counters(deltas)
+        self.suggestions_changed()
+        return superseded
+
+    def update_counters(self, deltas, using=None):
+        """
+        Adds the (parent id, status) -> change deltas to the counters using F expressions.
+        Uses one update for each (status, change) group, the missing counters are created for positive changes only.
+        """
+        groups = {}
+        for (parent_id, status), change in deltas.items():
+            if change:
+                groups.setdefault((status, change), []).append(parent_id)
+        counters = self.counter_model.objects.using(using)
+        for (status, change), parent_ids in groups.items():
+            updated = counters.filter(parent_id__in=parent_ids, status=status).update(count=models.F('count') + change)
+            if updated == len(parent_ids) or change < 0:
+                continue
+            missing = set(parent_ids) - set(
+                counters.filter(parent_id__in=parent_ids, status=status).values_list('parent_id', flat=True)
+            )
+            # created with 0 and updated so a counter created meanwhile by someone else is not overwritten
+            counters.bulk_create([self.counter_model(parent_id=parent_id, status=status) for parent_id in missing],
+                                 ignore_conflicts=True)
+            counters.filter(parent_id__in=missing, status=status).update(count=models.F('count') + change)
+
+    def post_save_counters(self, instance, created, update_fields, raw, using=None, **kwargs):
+        if raw:
+            return
+        parent_id = instance.edit_suggestion_parent_id
+        status = instance.edit_suggestion_status
+        if created:
+            self.update_counters({(parent_id, status): 1}, using)
+        elif status != self.Status.UNDER_REVIEWS and (update_fields is None or 'edit_suggestion_status' in update_fields):
+            # only edit suggestions under review can be saved, the status changed
+            self.update_counters({(parent_id, self.Status.UNDER_REVIEWS): -1, (parent_id, status): 1}, using)
+
+    def post_delete_counters(self, instance, using=None, **kwargs):
+        if instance.__dict__.get('_edit_suggestion_counted'):
+            return
+        self.update_counters({(instance.edit_suggestion_parent_id, instance.edit_suggestion_status): -1}, using)
+
+    def rebuild_counters(self):
+        """
+        Counts again the edit suggestions of every parent by status and replaces the counters.
+        Returns the number of counters.
+        """
+        rows = self.edit_suggestion_model.objects.order_by() \
+            .values_list('edit_suggestion_parent_id', 'edit_suggestion_status').annotate(models.Count('pk'))
+        counters = [self.counter_model(parent_id=parent_id, status=status, count=count) for parent_id, status, count in rows]
+        with transaction.atomic(using=router.db_for_write(self.counter_model)):
+            self.counter_model.objects.all().delete()
+            self.counter_model.objects.bulk_create(counters, batch_size=1000)
+        return len(counters)
+
+    def tracked_values(self, instance):
+        """
+        Values of the tracked fields of a parent or edit suggestion: field name -> value.
+        Foreign fields values are ids, m2m values are sets of ids and m2m through values are lists of rows
+        with the through fields values.
+        """
+        values = {}
+        for field in self.tracked_fields['simple'] + self.tracked_fields['foreign']:
+            values[field] = getattr(instance, self.tracked_attnames[field])
+        for m2m_field in self.tracked_fields['m2m']:
+            name = m2m_field['name']
+            if 'through' in m2m_field:
+                self_field = m2m_field['through']['self_field']
+                values[name] = list(getattr(instance, name).through.objects.filter(**{self_field: instance})
+                                    .order_by('pk').values_list(*self.through_fields[name]))
+            else:
+                values[name] = set(getattr(instance, name).values_list('pk', flat=True))
+        return values
+
+    def parent_snapshots(self, parents):
+        """
+        Snapshots of the tracked values of the parents: parent pk -> json compatible values.
+        Uses one query for each m2m field
+        """
+        return self.snapshots(self.parent_model, parents)
+
+    def snapshots(self, model, instances):
+        """
+        Snapshots of the tracked values of parents or edit suggestions of ``model``: pk -> json compatible values.
+        Uses one query for each m2m field
+        """
+        values = {instance.pk: {} for instance in instances}
+        for instance in instances:
+            for field in self.tracked_fields['simple'] + self.tracked_fields['foreign']:
+                values[instance.pk][field] = getattr(instance, self.tracked_attnames[field])
+        for m2m_field in self.tracked_fields['m2m']:
+            name = m2m_field['name']
+            model_field = model._meta.get_field(name)
+            through = model_field.remote_field.through
+            if 'through' in m2m_field:
+                self_attname = through._meta.get_field(m2m_field['through']['self_field']).attname
+                for instance_values in values.values():
+                    instance_values[name] = []
+                rows = through.objects.filter(**{f'{self_attname}__in': list(values)}) \
+                    .order_by('pk').values_list(self_attname, *self.through_fields[name])
+                for row in rows:
+                    values[row[0]][name].append(row[1:])
+            else:
+                source = through._meta.get_field(model_field.m2m_field_name()).attname
+                target = through._meta.get_field(model_field.m2m_reverse_field_name()).attname
+                for instance_values in values.values():
+                    instance_values[name] = set()
+                rows = through.objects.filter(**{f'{source}__in': list(values)}).values_list(source, target)
+                for source_id, target_id in rows:
+                    values[source_id][name].add(target_id)
+        return {pk: self.snapshot(instance_values) for pk, instance_values in values.items()}
+
+    def snapshot(self, values):
+        """Tracked values as stored in the base snapshot, so they can be compared with it"""
+        values = {name: sorted(value) if isinstance(value, set) else value for name, value in values.items()}
+        return json.loads(json.dumps(values, cls=DjangoJSONEncoder))
+
+    def content_hash(self, instance, m2m_data=None):
+        """
+        sha256 of the tracked values of an edit suggestion being created: simple and foreign fields from the instance,
+        m2m from ``m2m_data`` (same format as bulk_new). The order of the m2m values doesn't matter.
+        None if there are m2m fields and no ``m2m_data``, the m2m values are added afterwards
+        """
+        if m2m_data is None and self.tracked_fields['m2m']:
+            return None
+        m2m_data = m2m_data or {}
+        values = {}
+        for field in self.tracked_fields['simple'] + self.tracked_fields['foreign']:
+            # to_python so '1' and 1 give the same hash. the parent field, with sparse_storage the edit suggestion
+            # has a property instead
+            model_field = self.parent_model._meta.get_field(field)
+            values[field] = model_field.to_python(getattr(instance, self.tracked_attnames[field]))
+        for m2m_field in self.tracked_fields['m2m']:
+            name = m2m_field['name']
+            if 'through' in m2m_field:
+                values[name] = sorted(
+                    json.dumps({key: str(getattr(value, 'pk', value)) for key, value in row.items()}, sort_keys=True)
+                    for row in m2m_data.get(name) or []
+                )
+            else:
+                values[name] = sorted(set(str(getattr(pk, 'pk', pk)) for pk in m2m_data.get(name) or []))
+        content = json.dumps(values, sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get_duplicate(self, parent, content_hash):
+        """Edit suggestion under review of the parent with the same content hash, with one indexed lookup"""
+        return self.edit_suggestion_model.objects.filter(
+            edit_suggestion_parent=parent,
+            edit_suggestion_content_hash=content_hash,
+            edit_suggestion_status=self.Status.UNDER_REVIEWS,
+        ).order_by('pk').first()
+
+    def auto_publish(self, queryset, user):
+        """
+        Publishes, oldest first, the edit suggestions under review from the queryset that merge without conflicts.
+        Needs ``three_way_merge``. Returns (published, conflicting) lists of edit suggestions.
+        """
+        published, conflicting = [], []
+        superseded_parents = set()
+        edit_suggestions = queryset.filter(edit_suggestion_status=self.Status.UNDER_REVIEWS) \
+            .select_related('edit_suggestion_parent').order_by('edit_suggestion_date_created', 'pk')
+        parents = {}
+        for instance in edit_suggestions:
+            if instance.edit_suggestion_parent_id in superseded_parents:
+                continue
+            # share the parent instance so the next edit suggestions merge against the published changes
+            instance.edit_suggestion_parent = parents.setdefault(
+                instance.edit_suggestion_parent_id, instance.edit_suggestion_parent
+            )
+            try:
+                instance.edit_suggestion_publish(user)
+            except exceptions.EditSuggestionConflictError:
+                conflicting.append(instance)
+                continue
+            published.append(instance)
+            if self.on_publish_supersede:
+                superseded_parents.add(instance.edit_suggestion_parent_id)
+        return published, conflicting
+
+    @measured('publish_many', lambda edit_suggestion: edit_suggestion.edit_suggestion_model)
+    def publish_many(self, queryset, user):
+        """
+        Publishes the edit suggestions under review from the queryset in a constant number of queries.
+        When a parent has more than one edit suggestion in the batch only the most recent one is published, the others
+        stay under review (or get superseded with ``on_publish_supersede``). Like publish, only the fields
+        the edit suggestion changes are written to the parent, merged with ``three_way_merge``.
+        ``post_save`` of the parent and ``m2m_changed`` signals are not sent.
+        Returns the published edit suggestions.
+        """
+        rows = list(queryset.filter(edit_suggestion_status=self.Status.UNDER_REVIEWS)
+                    .order_by().values_list('pk', 'edit_suggestion_parent_id'))
+        if not rows:
+            return []
+        using = router.db_for_write(self.edit_suggestion_model)
+        with transaction.atomic(using=using):
+            # the parents first, then the edit suggestions, same order as publish. both are read again once locked
+            parents = {
+                parent.pk: parent for parent in self.parent_model._default_manager.using(using).select_for_update()
+                .filter(pk__in=set(parent_id for pk, parent_id in rows)).order_by('pk')
+            }
+            edit_suggestions = list(
+                self.edit_suggestion_model.objects.using(using).select_for_update()
+                .filter(pk__in=[pk for pk, parent_id in rows], edit_suggestion_status=self.Status.UNDER_REVIEWS)
+                .order_by('edit_suggestion_date_created', 'pk')
+            )
+            if not edit_suggestions:
+                return []
+            # group by parent. ordered by date so the latest edit suggestion is the one kept
+            latest = {}
+            for instance in edit_suggestions:
+                instance.edit_suggestion_parent = parents[instance.edit_suggestion_parent_id]
+                latest[instance.edit_suggestion_parent_id] = instance
+            published = list(latest.values())
+            for instance in published:
+                if not self.change_status_condition(instance, user):
+                    raise PermissionDenied('User not allowed to publish the edit suggestion')
+                self.check_version(instance)
+            changes, conflicts = self.bulk_parent_changes(published)
+            if conflicts:
+                raise exceptions.EditSuggestionConflictError(
+                    'Fields changed since the edit suggestions were made: {}'.format(', '.join(
+                        '{} ({})'.format(pk, ', '.join(fields)) for pk, fields in conflicts.items()
+                    )),
+                    sorted(set(field for fields in conflicts.values() for field in fields))
+                )
+            # parents grouped by changed fields, so bulk_update writes only those
+            parents_by_fields = {}
+            for instance in published:
+                parent = instance.edit_suggestion_parent
+                fields = [field for field in self.tracked_fields['simple'] + self.tracked_fields['foreign']
+                          if field in changes[instance.pk]]
+                for field in fields:
+                    attname = self.tracked_attnames[field]
+                    setattr(parent, attname, getattr(instance, attname))
+                if self.version_field and changes[instance.pk]:
+                    setattr(parent, self.version_field, getattr(parent, self.version_field) + 1)
+                    fields.append(self.version_field)
+                if fields:
+                    parents_by_fields.setdefault(tuple(fields), []).append(parent)
+            for fields, group in parents_by_fields.items():
+                self.parent_model._default_manager.using(using).bulk_update(group, list(fields))
+            for m2m_field in self.tracked_fields['m2m']:
+                changed = {i.edit_suggestion_parent_id: i for i in published if m2m_field['name'] in changes[i.pk]}
+                if changed:
+                    self.bulk_copy_m2m(m2m_field, changed)
+            self.edit_suggestion_model.objects.using(using).filter(pk__in=[i.pk for i in published]).update(
+                edit_suggestion_status=self.Status.PUBLISHED,
+                edit_suggestion_date_updated=timezone.now(),
+            )
+            if self.status_counters:
+                deltas = {}
+                for instance in published:
+                    deltas[(instance.edit_suggestion_parent_id, self.Status.UNDER_REVIEWS)] = -1
+                    deltas[(instance.edit_suggestion_parent_id, self.Status.PUBLISHED)] = 1
+                self.update_counters(deltas, using)
+            if self.on_publish_supersede:
+                # the older edit suggestions of the batch are still under review, they get superseded here
+                self.supersede_siblings(published)
+        self.suggestions_changed()
+        for instance in published:
+            instance.edit_suggestion_status = self.Status.PUBLISHED
+            instance._edit_suggestion_db_status = self.Status.PUBLISHED
+        self.dispatch_hooks(self.post_publish, [(instance, user) for instance in published])
+        return published
+
+    def bulk_parent_changes(self, edit_suggestions):
+        """
+        Names of the tracked fields each edit suggestion changes compared to its parent, like ``get_parent_changes``,
+        or with ``three_way_merge`` like ``get_merge``. Returns (changes, conflicts): edit suggestion pk -> set of
+        field names, and edit suggestion pk -> names of the conflicting fields for the ones with conflicts.
+        Uses one query for each m2m field and model
+        """
+        values = self.snapshots(self.edit_suggestion_model, edit_suggestions)
+        parent_values = self.parent_snapshots([i.edit_suggestion_parent for i in edit_suggestions])
+        changes, conflicts = {}, {}
+        for instance in edit_suggestions:
+            mine, theirs = values[instance.pk], parent_values[instance.edit_suggestion_parent_id]
+            if self.three_way_merge and instance.edit_suggestion_base is not None:
+                changed, conflicting = self.merge_fields(mine, theirs, instance.edit_suggestion_base)
+                if conflicting:
+                    conflicts[instance.pk] = conflicting
+                changes[instance.pk] = set(changed)
+            else:
+                changes[instance.pk] = set(field for field, value in mine.items() if theirs[field] != value)
+        return changes, conflicts
+
+    def merge_fields(self, mine, theirs, base):
+        """
+        Three-way merge of the snapshots of an edit suggestion, of its parent and of the base.
+        Returns (names of the fields to write, names of the conflicting fields)
+        """
+        changed, conflicts = [], []
+        for field, value in mine.items():
+            if value == base.get(field) or value == theirs[field]:
+                # not changed by the edit suggestion or already the same in the parent
+                continue
+            if theirs[field] != base.get(field):
+                conflicts.append(field)
+            else:
+                changed.append(field)
+        return changed, conflicts
+
+    def archive_resolved(self, older_than, chunk_size=1000, purge=False):
+        """
+        Moves the published, rejected and superseded edit suggestions not updated since ``older_than``
+        to the archive model, or deletes them if ``purge`` is set. Works in chunks of ``chunk_size`` primary keys,
+        each in its own transaction, and deletes the m2m rows too. Delete signals are sent only when receivers are
+        connected, the counters are updated once by chunk.
+        Returns the number of archived (or deleted) edit suggestions.
+        """
+        if not purge and not self.archive:
+            raise ImproperlyConfigured('Archiving edit suggestions needs the archive option of EditSuggestion')
+        model = self.edit_suggestion_model
+        resolved = model.objects.filter(
+            edit_suggestion_status__in=[self.Status.PUBLISHED, self.Status.REJECTED, self.Status.SUPERSEDED],
+            edit_suggestion_date_updated__lt=older_than,
+        ).order_by('pk')
+        if self.sparse_storage:
+            # the values not stored are read from the parent
+            resolved = resolved.select_related('edit_suggestion_parent')
+        total = 0
+        last_pk = None
+        while True:
+            chunk = resolved if last_pk is None else resolved.filter(pk__gt=last_pk)
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            with transaction.atomic(using=router.db_for_write(model)):
+                self.archive_chunk(chunk, purge)
+            total += len(chunk)
+        if total:
+            self.suggestions_changed()
+        return total
+
+    def archive_chunk(self, chunk, purge):
+        model = self.edit_suggestion_model
+        using = router.db_for_write(model)
+        if not purge:
+            snapshots = self.snapshots(model, chunk)
+            self.archive_model.objects.using(using).bulk_create([
+                self.archive_model(
+                    edit_suggestion_id=instance.pk,
+                    edit_suggestion_author_id=instance.edit_suggestion_author_id,
+                    edit_suggestion_parent_id=instance.edit_suggestion_parent_id,
+                    edit_suggestion_date_created=instance.edit_suggestion_date_created,
+                    edit_suggestion_date_updated=instance.edit_suggestion_date_updated,
+                    edit_suggestion_reason=instance.edit_suggestion_reason,
+                    edit_suggestion_status=instance.edit_suggestion_status,
+                    edit_suggestion_reject_reason=instance.edit_suggestion_reject_reason,
+                    edit_suggestion_data=snapshots[instance.pk],
+                ) for instance in chunk
+            ])
+        if self.status_counters:
+            deltas = {}
+            for instance in chunk:
+                key = (instance.edit_suggestion_parent_id, instance.edit_suggestion_status)
+                deltas[key] = deltas.get(key, 0) - 1
+            self.update_counters(deltas, using)
+            for instance in chunk:
+                # counted above, skipped by post_delete_counters
+                instance._edit_suggestion_counted = True
+        # the regular deletion, collected from the loaded chunk so the edit suggestions aren't selected again.
+        # without delete signals receivers the m2m rows and the edit suggestions are deleted with one query each
+        collector = Collector(using=using)
+        collector.collect(chunk)
+        collector.delete()
+
+    def bulk_copy_m2m(self, m2m_field, edit_suggestions_by_parent):
+        """
+        Replaces the m2m relations of the parents with the ones of their edit suggestions
+        with one delete and one bulk insert
+        """
+        parent_ids = list(edit_suggestions_by_parent.keys())
+        edit_to_parent = {i.pk: parent_id for parent_id, i in edit_suggestions_by_parent.items()}
+        parent_field = self.parent_model._meta.get_field(m2m_field['name'])
+        edit_field = self.edit_suggestion_model._meta.get_field(m2m_field['name'])
+        parent_through = parent_field.remote_field.through
+        edit_through = edit_field.remote_field.through
+        if 'through' in m2m_field:
+            self_attname = parent_through._meta.get_field(m2m_field['through']['self_field']).attname
+            through_fields = self.through_fields[m2m_field['name']]
+            rows = edit_through.objects.filter(**{f'{self_attname}__in': list(edit_to_parent)}) \
+                .order_by('pk').values_list(self_attname, *through_fields)
+            new_children = [
+                parent_through(**{self_attname: edit_to_parent[row[0]]}, **dict(zip(through_fields, row[1:])))
+                for row in rows
+            ]
+            parent_through.objects.filter(**{f'{self_attname}__in': parent_ids}).delete()
+            parent_through.objects.bulk_create(new_children)
+            return
+        source = parent_through._meta.get_field(parent_field.m2m_field_name()).attname
+        target = parent_through._meta.get_field(parent_field.m2m_reverse_field_name()).attname
+        edit_source = edit_through._meta.get_field(edit_field.m2m_field_name()).attname
+        edit_target = edit_through._meta.get_field(edit_field.m2m_reverse_field_name()).attname
+        rows = edit_through.objects.filter(**{f'{edit_source}__in': list(edit_to_parent)}) \
+            .values_list(edit_source, edit_target)
+        pairs = set((edit_to_parent[edit_id], target_id) for edit_id, target_id in rows)
+        old_relations = models.Q(**{f'{source}__in': parent_ids})
+        if parent_field.remote_field.symmetrical and parent_field.remote_field.model == self.parent_model:
+            # symmetrical relations are stored in both directions
+            old_relations |= models.Q(**{f'{target}__in': parent_ids})
+            pairs |= set((target_id, parent_id) for parent_id, target_id in pairs)
+        parent_through.objects.filter(old_relations).delete()
+        parent_through.objects.bulk_create([parent_through(**{source: s, target: t}) for s, t in sorted(pairs)])
+
+    def bulk_new(self, rows, batch_size=500, send_signals=False):
+        """
+        Creates edit suggestions from (parent, data, m2m data) tuples using bulk inserts.
+        m2m data is a dict of m2m field name -> list of pks (list of dicts with 'pk' and the extra fields for through).
+        Rows are consumed in chunks of ``batch_size`` so an iterator keeps the memory bounded.
+        ``pre_save``/``post_save`` are sent for each edit suggestion only if ``send_signals`` is set.
+        Returns the number of created edit suggestions.
+        """
+        rows = iter(rows)
+        created = 0
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                return created
+            with transaction.atomic(using=router.db_for_write(self.edit_suggestion_model)):
+                created += self.bulk_new_chunk(chunk, send_signals)
+            self.suggestions_changed()
+
+    def bulk_new_chunk(self, chunk, send_signals):
+        model = self.edit_suggestion_model
+        using = router.db_for_write(model)
+        rows = []
+        for row in chunk:
+            parent, data, m2m_data = row if len(row) == 3 else (row[0], row[1], None)
+            instance = model(**data, edit_suggestion_parent=parent)
+            if self.sparse_storage:
+                self.prune_sparse_delta(instance)
+            if self.version_field:
+                self.set_base_version(instance)
+            if self.deduplicate:
+                instance.edit_suggestion_content_hash = self.content_hash(instance, m2m_data)
+            rows.append((instance, m2m_data))
+        if self.deduplicate:
+            rows = self.skip_duplicates(rows, using)
+        instances = []
+        m2m_rows = []
+        for instance, m2m_data in rows:
+            instances.append(instance)
+            if m2m_data:
+                m2m_rows.append((instance, m2m_data))
+            if send_signals:
+                models.signals.pre_save.send(sender=model, instance=instance, raw=False, using=using,
+                                             update_fields=None)
+        if self.three_way_merge:
+            snapshots = self.parent_snapshots([i.edit_suggestion_parent for i in instances if i.edit_suggestion_base is None])
+            for instance in instances:
+                if instance.edit_suggestion_base is None:
+                    instance.edit_suggestion_base = snapshots[instance.edit_suggestion_parent_id]
+        if m2m_rows and not connections[using].features.can_return_rows_from_bulk_insert:
+            # the backend can't return the primary keys of a bulk insert, insert one by one the ones having m2m
+            with_m2m = set(id(instance) for instance, m2m_data in m2m_rows)
+            for instance, m2m_data in m2m_rows:
+                # _save_table inserts without sending the save signals
+                instance._save_table(cls=model._meta.concrete_model, force_insert=True, using=using)
+                instance._state.adding = False
+                instance._state.db = using
+            model.objects.using(using).bulk_create([i for i in instances if id(i) not in with_m2m])
+        else:
+            model.objects.using(using).bulk_create(instances)
+        for m2m_field in self.tracked_fields['m2m']:
+            self.bulk_insert_m2m(m2m_field, m2m_rows, using)
+        if self.status_counters and not send_signals:
+            # with signals the counters are updated by post_save
+            deltas = {}
+            for instance in instances:
+                key = (instance.edit_suggestion_parent_id, instance.edit_suggestion_status)
+                deltas[key] = deltas.get(key, 0) + 1
+            self.update_counters(deltas, using)
+        for instance in instances:
+            instance._edit_suggestion_db_status = instance.edit_suggestion_status
+            if send_signals:
+                models.signals.post_save.send(sender=model, instance=instance, created=True, update_fields=None,
+                                              raw=False, using=using)
+        return len(instances)
+
+    def skip_duplicates(self, rows, using):
+        """
+        Drops the (instance, m2m data) rows identical to an edit suggestion under review of the same parent,
+        or to a previous row, with one query
+        """
+        existing = set(self.edit_suggestion_model.objects.using(using).filter(
+            edit_suggestion_parent_id__in=set(instance.edit_suggestion_parent_id for instance, m2m_data in rows),
+            edit_suggestion_content_hash__in=set(instance.edit_suggestion_content_hash for instance, m2m_data in rows
+                                                 if instance.edit_suggestion_content_hash is not None),
+            edit_suggestion_status=self.Status.UNDER_REVIEWS,
+        ).values_list('edit_suggestion_parent_id', 'edit_suggestion_content_hash'))
+        kept = []
+        for instance, m2m_data in rows:
+            key = (instance.edit_suggestion_parent_id, instance.edit_suggestion_content_hash)
+            if instance.edit_suggestion_content_hash is None:
+                # not deduplicated
+                kept.append((instance, m2m_data))
+            elif key not in existing:
+                existing.add(key)
+                kept.append((instance, m2m_data))
+        return kept
+
+    def bulk_insert_m2m(self, m2m_field, m2m_rows, using):
+        edit_field = self.edit_suggestion_model._meta.get_field(m2m_field['name'])
+        edit_through = edit_field.remote_field.through
+        new_relations = []
+        if 'through' in m2m_field:
+            self_attname = edit_through._meta.get_field(m2m_field['through']['self_field']).attname
+            rel_attname = edit_through._meta.get_field(m2m_field['through']['rel_field']).attname
+            for instance, m2m_data in m2m_rows:
+                for child_data in m2m_data.get(m2m_field['name'], []):
+                    child = {key: value for key, value in child_data.items() if key != 'pk'}
+                    child[self_attname] = instance.pk
+                    child[rel_attname] = child_data['pk']
+                    new_relations.append(edit_through(**child))
+        else:
+            source = edit_through._meta.get_field(edit_field.m2m_field_name()).attname
+            target = edit_through._meta.get_field(edit_field.m2m_reverse_field_name()).attname
+            for instance, m2m_data in m2m_rows:
+                for pk in dict.fromkeys(m2m_data.get(m2m_field['name'], [])):
+                    new_relations.append(edit_through(**{source: instance.pk, target: pk}))
+        edit_through.objects.using(using).bulk_create(new_relations)
+
     def pre_save_edit_suggestion(self, instance, raw, update_fields, using=None, **kwargs):
+        if self.sparse_storage and not raw:
+            self.prune_sparse_delta(instance)
         # can edit only if the status is REVIEW
+        if instance.pk is None:
+            if self.version_field and not raw:
+                self.set_base_version(instance)
+            if self.three_way_merge and not raw and instance.edit_suggestion_base is None:
+                parent = instance.edit_suggestion_parent
+                instance.edit_suggestion_base = self.parent_snapshots([parent])[parent.pk]
+            return
+        # the status from the database is kept on the instance when it gets loaded or saved
+        db_status = instance.__dict__.get('_edit_suggestion_db_status')
+        if db_status is None:
+            # status not known (ex: deferred or instance built with a pk), get only the status
+            db_status = self.edit_suggestion_model.objects.using(using).filter(pk=instance.pk) \
+                .values_list('edit_suggestion_status', flat=True).first()
+        if db_status is not None and db_status != self.Status.UNDER_REVIEWS:
+            raise PermissionDenied('Edit suggestion cannot be modified once the status changed')
+        if self.deduplicate and not raw and instance.edit_suggestion_status == self.Status.UNDER_REVIEWS:
+            self.clear_content_hash(instance, update_fields, using)
+
+    def clear_content_hash(self, instance, update_fields, using):
+        # the hash is of the values on creation, an edited edit suggestion is not a duplicate of anything anymore
+        if instance.edit_suggestion_content_hash is None:
+            return
+        if update_fields is not None:
+            tracked = set(self.tracked_fields['simple'] + self.tracked_fields['foreign'])
+            tracked.update(self.tracked_attnames[field] for field in list(tracked))
+            if not tracked.intersection(update_fields):
+                return
+            if 'edit_suggestion_content_hash' not in update_fields:
+                # not saved with the instance
+                self.edit_suggestion_model.objects.using(using).filter(pk=instance.pk) \
+                    .update(edit_suggestion_content_hash=None)
+        instance.edit_suggestion_content_hash = None
+
+    def pre_save_parent(self, instance, raw, update_fields, **kwargs):
+        # bump the version on every update of the parent, in the UPDATE so concurrent saves don't lose one
+        if raw or instance._state.adding or (update_fields is not None and self.version_field not in update_fields):
+            return
+        setattr(instance, self.version_field, models.F(self.version_field) + 1)
+
+    def post_save_parent(self, instance, raw, using, **kwargs):
+        # read the bumped version
+        if isinstance(getattr(instance, self.version_field), models.expressions.Combinable):
+            instance.refresh_from_db(using=using, fields=[self.version_field])
+
+    def set_base_version(self, instance):
+        if instance.edit_suggestion_base_version is None:
+            instance.edit_suggestion_base_version = getattr(instance.edit_suggestion_parent, self.version_field)
+
+    def check_version(self, instance):
+        """Raises EditSuggestionConflictError if the parent changed since the edit suggestion was made"""
+        if not self.version_field or self.three_way_merge:
+            # the merge checks the fields themselves
+            return
+        if instance.edit_suggestion_base_version is None:
+            # made before version_field was set, the version is unknown
+            return
+        if instance.edit_suggestion_base_version != getattr(instance.edit_suggestion_parent, self.version_field):
+            raise exceptions.EditSuggestionConflictError(
+                'The edit suggestion was made against an older version of the {}'.format(self.parent_model_name)
+            )
+
+
+class HookThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool closing the database connections opened by each task, they belong to the worker thread"""
+
+    def submit(self, fn, *args, **kwargs):
+        return super(HookThreadPoolExecutor, self).submit(close_connections_after, fn, *args, **kwargs)
+
+
+def close_connections_after(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def get_default_hook_executor():
+    global default_hook_executor
+    if default_hook_executor is None:
+        default_hook_executor = HookThreadPoolExecutor(max_workers=4, thread_name_prefix='edit_suggestion_hooks')
+    return default_hook_executor
+
+
+def run_hooks(hook, calls):
+    # runs in the executor, a failing hook doesn't stop the others
+    for args in calls:
         try:
-            from_db = self.edit_suggestion_model.objects.get(pk=instance.pk)
-            if from_db.edit_suggestion_status != self.Status.UNDER_REVIEWS:
-                raise PermissionDenied('Edit suggestion cannot be modified once the status changed')
-        except self.edit_suggestion_model.DoesNotExist:
-            pass
+            hook(*args)
+        except Exception:
+            logger.exception('Edit suggestion hook %s failed', getattr(hook, '__name__', hook))
+
+
+def sparse_value_accessors(attname, field):
+
+    def get_value(instance):
+        delta = instance.edit_suggestion_delta
+        if attname in delta:
+            return field.to_python(delta[attname])
+        return getattr(instance.edit_suggestion_parent, attname)
+
+    def set_value(instance, value):
+        instance.edit_suggestion_delta[attname] = value
+
+    return get_value, set_value
+
+
+def sparse_related_accessors(name, attname, field):
+    cache_name = f'_sparse_{name}_cache'
+
+    def get_related(instance):
+        if attname not in instance.edit_suggestion_delta:
+            return getattr(instance.edit_suggestion_parent, name)
+        pk = getattr(instance, attname)
+        cached = instance.__dict__.get(cache_name)
+        if cached is None or cached.pk != pk:
+            cached = None if pk is None else field.related_model._default_manager.get(pk=pk)
+            instance.__dict__[cache_name] = cached
+        return cached
+
+    def set_related(instance, value):
+        instance.edit_suggestion_delta[attname] = None if value is None else value.pk
+        instance.__dict__[cache_name] = value
+
+    return get_related, set_related
 
 
 def transform_field(field):
@@ -445,20 +1456,98 @@ class EditSuggestionChanges(object):
     should diff against the tracked model
     '''
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(EditSuggestionChanges, cls).from_db(db, field_names, values)
+        # remember the status from database so the pre_save check doesn't need to query it
+        instance._edit_suggestion_db_status = instance.__dict__.get('edit_suggestion_status')
+        return instance
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        super(EditSuggestionChanges, self).save(force_insert=force_insert, force_update=force_update, using=using,
+                                                update_fields=update_fields)
+        if update_fields is None or 'edit_suggestion_status' in update_fields:
+            self._edit_suggestion_db_status = self.edit_suggestion_status
+        self._meta.edit_suggestion.suggestions_changed()
+
+    def delete(self, using=None, keep_parents=False):
+        deleted = super(EditSuggestionChanges, self).delete(using=using, keep_parents=keep_parents)
+        self._meta.edit_suggestion.suggestions_changed()
+        return deleted
+
+    def refresh_from_db(self, using=None, fields=None):
+        super(EditSuggestionChanges, self).refresh_from_db(using=using, fields=fields)
+        if fields is None or 'edit_suggestion_status' in fields:
+            self._edit_suggestion_db_status = self.edit_suggestion_status
+
+    @measured('diff')
     def diff_against_parent(self):
         changes = []
         changed_fields = []
-        old_values = model_to_dict(self.edit_suggestion_parent)
-        current_values = model_to_dict(self)
-        fields_to_check = self.edit_suggestion_tracked_fields['simple'] + self.edit_suggestion_tracked_fields['foreign'] + [f['name'] for f in self.edit_suggestion_tracked_fields['m2m']]
-        for field in fields_to_check :
-            if field in old_values and old_values[field] != current_values[field]:
-                change = ModelChange(field, old_values[field], current_values[field])
+        parent = self.edit_suggestion_parent
+        for field, attname in self.get_diff_fields():
+            if attname is None:
+                # m2m field. uses the prefetched objects if available
+                old_value = list(getattr(parent, field).all())
+                current_value = list(getattr(self, field).all())
+            else:
+                old_value = getattr(parent, attname)
+                current_value = getattr(self, attname)
+            if old_value != current_value:
+                change = ModelChange(field, old_value, current_value)
                 changes.append(change)
                 changed_fields.append(field)
 
         return ModelDelta(changes, changed_fields, self.edit_suggestion_parent, self)
 
+    async def adiff_against_parent(self):
+        return await sync_to_async(self.diff_against_parent)()
+
+    def get_parent_changes(self):
+        """
+        Returns a dict of the tracked fields that are different from the parent: field name -> edit suggestion value.
+        Values are in the ``EditSuggestion.tracked_values`` format.
+        """
+        edit_suggestion = self._meta.edit_suggestion
+        values = edit_suggestion.tracked_values(self)
+        parent_values = edit_suggestion.tracked_values(self.edit_suggestion_parent)
+        return {field: value for field, value in values.items() if parent_values[field] != value}
+
+    def get_merge(self):
+        """
+        Three-way merge of the edit suggestion, its base snapshot and the current parent.
+        Returns (changes, conflicts): changes like ``get_parent_changes`` but only for the fields the edit suggestion
+        changed from its base, conflicts the names of the fields changed differently in the parent since.
+        """
+        edit_suggestion = self._meta.edit_suggestion
+        values = edit_suggestion.tracked_values(self)
+        parent_values = edit_suggestion.tracked_values(self.edit_suggestion_parent)
+        base = self.edit_suggestion_base
+        if base is None:
+            # made before three_way_merge was set
+            return {field: value for field, value in values.items() if parent_values[field] != value}, []
+        changed, conflicts = edit_suggestion.merge_fields(
+            edit_suggestion.snapshot(values), edit_suggestion.snapshot(parent_values), base
+        )
+        return {field: values[field] for field in changed}, conflicts
+
+    @classmethod
+    def get_diff_fields(cls):
+        """
+        Returns (field name, attribute name) of the tracked fields that are editable in the parent.
+        Attribute name is None for m2m fields.
+        """
+        edit_suggestion = cls._meta.edit_suggestion
+        parent_fields = {f.name: f for f in edit_suggestion.parent_model._meta.get_fields()}
+        diff_fields = []
+        for field in edit_suggestion.tracked_fields['simple'] + edit_suggestion.tracked_fields['foreign']:
+            if field in parent_fields and parent_fields[field].editable:
+                diff_fields.append((field, edit_suggestion.tracked_attnames[field]))
+        for m2m_field in edit_suggestion.tracked_fields['m2m']:
+            if m2m_field['name'] in parent_fields and parent_fields[m2m_field['name']].editable:
+                diff_fields.append((m2m_field['name'], None))
+        return diff_fields
+
 
 class ModelChange(object):
     def __init__(self, field_name, old_value, new_value):
@@ -4,11 +4,22 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.utils.module_loading import import_string
 from django.core.exceptions import PermissionDenied
+from .exceptions import EditSuggestionConflictError, EditSuggestionDuplicateError
+from .instrumentation import measured
+
+
+def get_view_model(view):
+    return view.get_edit_suggestion_model()
 
 
 class ModelViewsetWithEditSuggestion(ModelViewSet):
 
+    def get_edit_suggestion_model(self):
+        model = self.get_queryset().model
+        return getattr(model, model._meta.edit_suggestion_manager_attribute).model
+
     @action(methods=['GET'], detail=True)
+    @measured('rest.list', get_view_model)
     def edit_suggestions(self, request, *args, **kwargs):
         parent = self.get_object()
         if not hasattr(self.serializer_class, 'get_edit_suggestion_serializer'):
@@ -18,10 +29,18 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
                 'static method that '
                 'returns edit suggestion serializer'
             )
-        if 'status' in self.request.GET:
-            queryset = parent.edit_suggestions.filter(edit_suggestion_status=self.request.GET['status']).all()
+        if 'applicable' in self.request.GET:
+            if not parent.edit_suggestions.model._meta.edit_suggestion.version_field:
+                return Response(status=400, data={
+                    'error': True,
+                    'message': 'applicable needs the version_field option of EditSuggestion'
+                })
+            # only the ones under review made against the current version of the parent
+            queryset = parent.edit_suggestions.applicable()
         else:
             queryset = parent.edit_suggestions.all()
+        if 'status' in self.request.GET:
+            queryset = queryset.filter(edit_suggestion_status=self.request.GET['status'])
         edit_suggestions_serializer = self.serializer_class.get_edit_suggestion_listing_serializer()
         page = self.paginate_queryset(queryset)
 
@@ -33,6 +52,7 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
         return Response(serialized_data.data)
 
     @action(methods=['POST'], detail=True)
+    @measured('rest.create', get_view_model)
     def edit_suggestion_create(self, request, *args, **kwargs):
         serialized_data = self.serializer_class(data=request.data)
         validated_data = serialized_data.run_validation(request.data)
@@ -40,11 +60,20 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
         parent = self.get_object()
         try:
             instance = self.edit_suggestion_perform_create(parent, validated_data)
+        except EditSuggestionDuplicateError as e:
+            return Response(status=409, data={
+                'error': True,
+                'message': str(e),
+                'edit_suggestion_id': e.duplicate.pk,
+            })
         except Exception as e:
             return Response(status=401, data={
                 'error': True,
                 'message': str(e)
             })
+        if getattr(instance, 'edit_suggestion_merged', False):
+            # identical to an edit suggestion under review, nothing created
+            return Response(serializer(instance).data, status=status.HTTP_200_OK)
         return Response(serializer(instance).data, status=status.HTTP_201_CREATED)
 
     def edit_suggestion_perform_create(self, parent, data):
@@ -63,7 +92,16 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
                 # In parent serializer ``.run_validation`` should replace field name of foreign_field with foreign_field_id
                 # We have a silent fallback to using raw field data if that's not the case
                 data_dict[f'{f}_id'] = data[f'{f}_id'] if f'{f}_id' in data else self.request.data[f'{f}_id']
+        # the m2m are added afterwards, they are given only for the content hash
+        duplicate = parent.edit_suggestions.check_duplicate(
+            data_dict, {f['name']: data[f['name']] for f in fields_m2m if f['name'] in data}
+        )
+        if duplicate is not None:
+            return duplicate
         instance = parent.edit_suggestions.new(data_dict)
+        if getattr(instance, 'edit_suggestion_merged', False):
+            # an identical one was created concurrently
+            return instance
         self.edit_sugestion_handle_m2m_fields(instance, data, fields_m2m)
         return instance
 
@@ -101,16 +139,21 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
         '''
         m2m_field = getattr(instance, f['name'])
         through_data = data[f['name']]
-        m2m_objects_id_list = [o['pk'] for o in through_data]
-        m2m_objects = [obj for obj in f['model'].objects.filter(pk__in=m2m_objects_id_list)]
-        for idx, m2m_obj in enumerate(m2m_objects):
-            data = through_data[idx]
-            data[f['through']['self_field']] = instance
-            data[f['through']['rel_field']] = m2m_obj
-            del data['pk']
-            m2m_field.through.objects.create(**data)
+        m2m_objects = {
+            str(pk): obj for pk, obj in f['model'].objects.in_bulk([o['pk'] for o in through_data]).items()
+        }
+        children = []
+        for child_data in through_data:
+            if str(child_data['pk']) not in m2m_objects:
+                continue
+            child = {key: value for key, value in child_data.items() if key != 'pk'}
+            child[f['through']['self_field']] = instance
+            child[f['through']['rel_field']] = m2m_objects[str(child_data['pk'])]
+            children.append(m2m_field.through(**child))
+        m2m_field.through.objects.bulk_create(children)
 
     @action(methods=['POST'], detail=True)
+    @measured('rest.publish', get_view_model)
     def edit_suggestion_publish(self, request, *args, **kwargs):
         try:
             parent = self.get_object()
@@ -118,12 +161,19 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
                 pk=request.data['edit_suggestion_id'],
                 edit_suggestion_parent=parent
             )
+            # already loaded, publish doesn't need to fetch it again
+            edit_instance.edit_suggestion_parent = parent
             edit_instance.edit_suggestion_publish(request.user)
         except PermissionDenied as e:
             return Response(status=403, data={
                 'error': True,
                 'message': str(e)
             })
+        except EditSuggestionConflictError as e:
+            return Response(status=409, data={
+                'error': True,
+                'message': str(e)
+            })
         except Exception as e:
             return Response(status=401, data={
                 'error': True,
@@ -135,6 +185,7 @@ class ModelViewsetWithEditSuggestion(ModelViewSet):
         })
 
     @action(methods=['POST'], detail=True)
+    @measured('rest.reject', get_view_model)
     def edit_suggestion_reject(self, request, *args, **kwargs):
         try:
             parent = self.get_object()
@@ -40,6 +40,7 @@ class SimpleParentModel(models.Model):
         change_status_condition=condition_check,
         post_publish=post_publish,
         post_reject=post_reject,
+        memoize_counts=True,
     )
 
     def __str__(self):
@@ -112,6 +113,8 @@ class ParentM2MThroughModel(models.Model):
         change_status_condition=condition_check,
         bases=(VotableMixin,),  # optional. bases are used to build the edit suggestion model upon them
         user_model=User,  # optional. uses the default user model
+        archive=True,  # resolved edit suggestions can be archived
+        deduplicate='merge',  # identical edit suggestions under review are not created again
     )
 
     def __str__(self):
@@ -124,7 +127,77 @@ class ForeignKeyModel(models.Model):
     edit_suggestions = EditSuggestion(
         change_status_condition=condition_check,
         user_model=User,
+        review_queue=True,
     )
 
     def __str__(self):
-        return f'{self.name} with foreign {self.foreign}'
\ No newline at end of file
+        return f'{self.name} with foreign {self.foreign}'
+
+class Article(models.Model):
+    title = models.CharField(max_length=128)
+    body = models.TextField()
+    published_on = models.DateField(null=True, blank=True)
+    category = models.ForeignKey(Tag, null=True, blank=True, on_delete=models.SET_NULL)
+    version = models.PositiveIntegerField(default=0)
+    edit_suggestions = EditSuggestion(
+        change_status_condition=condition_check,
+        user_model=User,
+        on_publish_supersede='supersede',
+        version_field='version',
+    )
+
+    def __str__(self):
+        return self.title
+
+
+class SparseArticle(models.Model):
+    title = models.CharField(max_length=128)
+    body = models.TextField()
+    published_on = models.DateField(null=True, blank=True)
+    category = models.ForeignKey(Tag, null=True, blank=True, on_delete=models.SET_NULL)
+    tags = models.ManyToManyField(Tag, related_name='sparse_articles')
+    edit_suggestions = EditSuggestion(
+        m2m_fields=(({
+                         'name': 'tags',
+                         'model': Tag,
+                     },)),
+        change_status_condition=condition_check,
+        user_model=User,
+        sparse_storage=True,  # only the changed fields are stored
+    )
+
+    def __str__(self):
+        return self.title
+
+
+class SparseNote(models.Model):
+    title = models.CharField(max_length=128)
+    category = models.ForeignKey(Tag, null=True, blank=True, on_delete=models.SET_NULL)
+    edit_suggestions = EditSuggestion(
+        change_status_condition=condition_check,
+        user_model=User,
+        sparse_storage=True,
+        deduplicate='merge',
+    )
+
+    def __str__(self):
+        return self.title
+
+
+class WikiPage(models.Model):
+    title = models.CharField(max_length=128)
+    body = models.TextField(blank=True)
+    tags = models.ManyToManyField(Tag, related_name='wiki_pages')
+    edit_suggestions = EditSuggestion(
+        m2m_fields=(({
+                         'name': 'tags',
+                         'model': Tag,
+                     },)),
+        change_status_condition=condition_check,
+        user_model=User,
+        three_way_merge=True,  # only the fields changed by the edit suggestion are published
+        status_counters=True,
+    )
+
+    def __str__(self):
+        return self.title
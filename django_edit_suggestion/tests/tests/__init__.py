@@ -1,2 +1,3 @@
 from .models import BaseFunctionsTest
-from .django_rest import DjangoRestViews
\ No newline at end of file
+from .django_rest import DjangoRestViews
+from .query_budgets import QueryBudgetTest
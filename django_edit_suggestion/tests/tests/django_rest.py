@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from django.urls import reverse
+from django_edit_suggestion import instrumentation
 from ..models import ParentModel, Tag, EditSuggestion, ParentM2MThroughModel, SharedChild, ForeignKeyModel
 
 
@@ -44,6 +45,9 @@ class DjangoRestViews(APITestCase):
         url = reverse('parent-viewset-edit-suggestions', kwargs={'pk': 2})
         response = self.client.get(url, format='json')
         self.assertEqual(len(response.data), 2)
+        # the parent model has no version_field
+        response = self.client.get(url, {'applicable': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
 
     def test_publish_edit_suggestion(self):
         url = reverse('parent-viewset-edit-suggestion-create', kwargs={'pk': 2})
@@ -189,3 +193,34 @@ class DjangoRestViews(APITestCase):
         )
         self.assertEqual(edsug_res.status_code, 201)
         self.assertEqual(edsug_res.data['foreign']['pk'], foreign_2.pk)
+
+    def test_create_duplicate_edit_suggestion(self):
+        child = SharedChild.objects.create(name='child')
+        parent = ParentM2MThroughModel.objects.create(name='parent')
+        self.client.force_login(User.objects.get(pk=1))
+        url = reverse('m2m-through-viewset-edit-suggestion-create', kwargs={'pk': parent.pk})
+        data = {'name': 'edited', 'edit_suggestion_reason': 'test', 'children': [{'pk': child.pk, 'order': 1}]}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        # same content, the existing edit suggestion is returned
+        duplicate_response = self.client.post(url, data, format='json')
+        self.assertEqual(duplicate_response.status_code, 200)
+        self.assertEqual(parent.edit_suggestions.count(), 1)
+        data['children'][0]['order'] = 2
+        self.assertEqual(self.client.post(url, data, format='json').status_code, 201)
+        self.assertEqual(parent.edit_suggestions.count(), 2)
+
+    def test_instrumentation(self):
+        collector = instrumentation.InMemoryCollector()
+        instrumentation.set_collector(collector)
+        self.client.force_login(User.objects.get(pk=1))
+        try:
+            self.client.post(reverse('parent-viewset-edit-suggestion-create', kwargs={'pk': 1}),
+                             {'name': 'edited', 'edit_suggestion_reason': 'test', 'tags': [1, 2]}, format='json')
+            self.client.get(reverse('parent-viewset-edit-suggestions', kwargs={'pk': 1}), format='json')
+        finally:
+            instrumentation.set_collector(None)
+        label = ParentModel.edit_suggestions.model._meta.label
+        stats = collector.stats()
+        self.assertEqual(set(stats), {('rest.create', label), ('new', label), ('rest.list', label)})
+        self.assertGreaterEqual(stats[('rest.create', label)]['queries'], stats[('new', label)]['queries'])
@@ -1,7 +1,29 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import os
+import pickle
+import tempfile
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth.models import User, PermissionDenied
+from django_edit_suggestion import instrumentation
+from django_edit_suggestion.context import get_current_request, get_current_user
+from django_edit_suggestion.exceptions import EditSuggestionConflictError, EditSuggestionDuplicateError
+from django_edit_suggestion.manager import prefetch_edit_suggestions
+from django_edit_suggestion.middleware import EditSuggestionRequestMiddleware
 from django_edit_suggestion.models import EditSuggestion
-from ..models import SimpleParentModel, Tag, ParentModel, ParentM2MSelfModel, SharedChild, ParentM2MThroughModel, ForeignKeyModel
+from ..models import SimpleParentModel, Tag, ParentModel, ParentM2MSelfModel, SharedChild, ParentM2MThroughModel, ForeignKeyModel, \
+    SparseArticle, Article, WikiPage, SparseNote
 
 
 class BaseFunctionsTest(TestCase):
@@ -66,6 +88,74 @@ class BaseFunctionsTest(TestCase):
         esi1.delete()
         esi2.delete()
 
+    def test_bulk_new(self):
+        tags = Tag.objects.all()
+        author = User.objects.first()
+        parents = list(ParentModel.objects.all())
+        rows = (
+            (parents[i % 2], {'name': f'bulk {i}', 'edit_suggestion_author': author}) for i in range(5)
+        )
+        # savepoint, insert and release savepoint for each chunk
+        with self.assertNumQueries(9):
+            created = ParentModel.edit_suggestions.bulk_new(rows, batch_size=2)
+        self.assertEqual(created, 5)
+        self.assertEqual(parents[0].edit_suggestions.count(), 3)
+        self.assertEqual(parents[1].edit_suggestions.count(), 2)
+
+        created = ParentModel.edit_suggestions.bulk_new([
+            (parents[0], {'name': 'with tags'}, {'tags': [tags[1].pk, tags[2].pk]}),
+            (parents[1], {'name': 'without tags'}, {}),
+        ])
+        self.assertEqual(created, 2)
+        self.assertEqual(list(parents[0].edit_suggestions.get(name='with tags').tags.all()), [tags[1], tags[2]])
+        self.assertEqual(parents[1].edit_suggestions.get(name='without tags').tags.count(), 0)
+
+        schild = SharedChild.objects.create(name='child')
+        through_parent = ParentM2MThroughModel.objects.create(name='through parent')
+        ParentM2MThroughModel.edit_suggestions.bulk_new([
+            (through_parent, {'name': 'bulk through'}, {'children': [{'pk': schild.pk, 'order': 4}]}),
+        ])
+        edited = through_parent.edit_suggestions.get()
+        self.assertEqual(
+            list(edited.children.through.objects.filter(parent=edited).values_list('shared_child', 'order')),
+            [(schild.pk, 4)]
+        )
+        # bulk created edit suggestions are checked like the others
+        edited.edit_suggestion_publish(user=User.objects.get(is_staff=True))
+        with self.assertRaises(PermissionDenied):
+            edited.save()
+
+    def test_manager_cache(self):
+        self.assertIs(ParentModel.edit_suggestions, ParentModel.edit_suggestions)
+        parent_instance = ParentModel.objects.get(id=1)
+        self.assertIs(parent_instance.edit_suggestions, parent_instance.edit_suggestions)
+        self.assertIs(parent_instance.edit_suggestions.instance, parent_instance)
+        self.assertIsNot(ParentModel.objects.get(id=2).edit_suggestions, parent_instance.edit_suggestions)
+        # instances with a cached manager can still be pickled
+        self.create_advanced_edit(parent_instance)
+        unpickled = pickle.loads(pickle.dumps(parent_instance))
+        self.assertEqual(unpickled.edit_suggestions.count(), 1)
+
+    def test_memoized_pending_count(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent_instance = SimpleParentModel.objects.get(id=1)
+        esi = self.create_simple_edit(parent_instance)
+        with self.assertNumQueries(1):
+            self.assertEqual(parent_instance.edit_suggestions.pending_count(), 1)
+            self.assertEqual(parent_instance.edit_suggestions.pending_count(), 1)
+        # changing edit suggestions invalidates the memoized count
+        self.create_simple_edit(parent_instance)
+        self.assertEqual(parent_instance.edit_suggestions.pending_count(), 2)
+        esi.edit_suggestion_publish(user=admin_user)
+        self.assertEqual(parent_instance.edit_suggestions.pending_count(), 1)
+        SimpleParentModel.edit_suggestions.bulk_new([(parent_instance, {'name': 'bulk'})])
+        self.assertEqual(parent_instance.edit_suggestions.pending_count(), 2)
+        # not memoized by default
+        parent_instance = ParentModel.objects.get(id=1)
+        with self.assertNumQueries(2):
+            parent_instance.edit_suggestions.pending_count()
+            parent_instance.edit_suggestions.pending_count()
+
     def test_advanced(self):
         tags = Tag.objects.all()
         parent_instance = ParentModel.objects.get(id=1)
@@ -140,6 +230,40 @@ class BaseFunctionsTest(TestCase):
             esi.save()
         esi.delete()
 
+    def test_publish_changed_fields_only(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent_instance = ParentModel.objects.get(id=1)
+        saved_fields = []
+
+        def parent_saved(instance, update_fields, **kwargs):
+            saved_fields.append(update_fields)
+
+        models.signals.post_save.connect(parent_saved, sender=ParentModel)
+        self.addCleanup(models.signals.post_save.disconnect, parent_saved, sender=ParentModel)
+
+        # nothing changed: the parent is not saved
+        esi = parent_instance.edit_suggestions.new({
+            'name': parent_instance.name,
+            'second_field': parent_instance.second_field,
+        })
+        esi.tags.add(*parent_instance.tags.all())
+        # status check, compare tags of edit suggestion and parent, save the edit suggestion and the savepoint queries
+        with self.assertNumQueries(6):
+            esi.edit_suggestion_publish(user=admin_user)
+        self.assertEqual(saved_fields, [])
+
+        # only the changed column is written
+        esi = parent_instance.edit_suggestions.new({
+            'name': parent_instance.name,
+            'second_field': 'changed',
+        })
+        esi.tags.add(*parent_instance.tags.all())
+        esi.edit_suggestion_publish(user=admin_user)
+        self.assertEqual(saved_fields, [frozenset(['second_field'])])
+        parent_instance.refresh_from_db()
+        self.assertEqual(parent_instance.second_field, 'changed')
+        self.assertEqual(list(parent_instance.tags.all()), [Tag.objects.get(id=1)])
+
     def test_reject(self):
         user = User.objects.all()
         parent_instance = SimpleParentModel.objects.get(id=1)
@@ -195,6 +319,85 @@ class BaseFunctionsTest(TestCase):
         self.assertEqual(changes.changes[0].new, [t for t in esi_m2m.tags.all()])
         self.assertEqual(changes.changes[0].old, [t for t in parent_instance.tags.all()])
 
+    def test_diff_many(self):
+        tags = Tag.objects.all()
+        for parent_instance in ParentModel.objects.all():
+            parent_instance.edit_suggestions.new({
+                'name': 'edited',
+                'second_field': parent_instance.second_field
+            }).tags.add(tags[0])
+            parent_instance.edit_suggestions.new({
+                'name': parent_instance.name,
+                'second_field': parent_instance.second_field
+            }).tags.add(tags[1])
+        queryset = ParentModel.edit_suggestions.all()
+        # edit suggestions with parents, edit suggestion tags, parent tags
+        with self.assertNumQueries(3):
+            deltas = ParentModel.edit_suggestions.diff_many(queryset)
+        self.assertEqual(len(deltas), 4)
+        for delta in deltas:
+            single = delta.new_record.diff_against_parent()
+            self.assertEqual(delta.changed_fields, single.changed_fields)
+            self.assertEqual([(c.old, c.new) for c in delta.changes], [(c.old, c.new) for c in single.changes])
+        self.assertEqual(sorted(d.changed_fields for d in deltas), [['name'], ['name'], ['tags'], ['tags']])
+
+    def test_sparse_storage(self):
+        admin_user = User.objects.get(is_staff=True)
+        tags = Tag.objects.all()
+        article = SparseArticle.objects.create(title='title', body='long body', published_on=datetime.date(2020, 1, 1))
+        article.tags.add(tags[0])
+        esi = article.edit_suggestions.new({
+            'title': 'edited title',
+            'body': 'long body',
+            'published_on': datetime.date(2020, 2, 1),
+            'category': tags[1],
+            'edit_suggestion_author': admin_user,
+        })
+        esi.tags.add(tags[0], tags[2])
+        # only the changed fields are stored, the body is the same as the parent
+        stored = SparseArticle.edit_suggestions.model.objects.values_list('edit_suggestion_delta', flat=True).get()
+        self.assertEqual(stored, {'title': 'edited title', 'published_on': '2020-02-01', 'category_id': tags[1].pk})
+
+        # reading is transparent
+        esi = article.edit_suggestions.get(pk=esi.pk)
+        self.assertEqual(esi.title, 'edited title')
+        self.assertEqual(esi.body, 'long body')
+        self.assertEqual(esi.published_on, datetime.date(2020, 2, 1))
+        self.assertEqual(esi.category, tags[1])
+        self.assertEqual(esi.category_id, tags[1].pk)
+        changes = esi.diff_against_parent()
+        self.assertEqual(changes.changed_fields, ['title', 'published_on', 'category', 'tags'])
+
+        # editing
+        esi.body = 'edited body'
+        esi.category = None
+        esi.save()
+        esi = article.edit_suggestions.get(pk=esi.pk)
+        self.assertEqual(esi.body, 'edited body')
+        self.assertIsNone(esi.category)
+
+        esi.edit_suggestion_publish(user=admin_user)
+        article.refresh_from_db()
+        self.assertEqual(article.title, 'edited title')
+        self.assertEqual(article.body, 'edited body')
+        self.assertEqual(article.published_on, datetime.date(2020, 2, 1))
+        self.assertIsNone(article.category)
+        self.assertEqual(list(article.tags.all()), [tags[0], tags[2]])
+
+    def test_sparse_storage_bulk(self):
+        admin_user = User.objects.get(is_staff=True)
+        articles = [SparseArticle.objects.create(title=f'title {i}', body='body') for i in range(2)]
+        SparseArticle.edit_suggestions.bulk_new(
+            (article, {'title': article.title, 'body': 'bulk body'}) for article in articles
+        )
+        self.assertEqual(
+            list(SparseArticle.edit_suggestions.model.objects.values_list('edit_suggestion_delta', flat=True)),
+            [{'body': 'bulk body'}, {'body': 'bulk body'}]
+        )
+        self.assertEqual([d.changed_fields for d in SparseArticle.edit_suggestions.diff_many()], [['body'], ['body']])
+        SparseArticle.edit_suggestions.publish_many(SparseArticle.edit_suggestions.all(), admin_user)
+        self.assertEqual(list(SparseArticle.objects.values_list('body', flat=True)), ['bulk body', 'bulk body'])
+
     def test_m2m_through_table(self):
         edit_user = User.objects.create(username='edit user')
         admin_user = User.objects.get(is_staff=True)
@@ -223,6 +426,21 @@ class BaseFunctionsTest(TestCase):
         self.assertEqual(parent_child_through.shared_child, edited_child_through.shared_child)
         self.assertEqual(parent_child_through.order, edited_child_through.order)
 
+    def test_m2m_through_publish_bulk_insert(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent = ParentM2MThroughModel.objects.create(name='parent')
+        edited = parent.edit_suggestions.new(dict(name='edited'))
+        children = [SharedChild.objects.create(name=f'child {i}') for i in range(5)]
+        for order, child in enumerate(children):
+            edited.children.through.objects.create(parent=edited, shared_child=child, order=order)
+        # status check, select edit and parent children, delete parent children, insert, save parent,
+        # save edit suggestion and the savepoint queries
+        with self.assertNumQueries(9):
+            edited.edit_suggestion_publish(user=admin_user)
+        self.assertEqual(
+            list(parent.children.through.objects.filter(parent=parent).values_list('shared_child', 'order')),
+            [(child.pk, order) for order, child in enumerate(children)]
+        )
 
     def test_foreign_model(self):
         edit_user = User.objects.create(username='edit user')
@@ -243,3 +461,689 @@ class BaseFunctionsTest(TestCase):
 
 
 
+    def test_publish_many(self):
+        admin_user = User.objects.get(is_staff=True)
+        tags = Tag.objects.all()
+        parents = ParentModel.objects.all()
+        for parent in parents:
+            older = parent.edit_suggestions.new({'name': 'older', 'second_field': 'older'})
+            older.tags.add(tags[2])
+            newer = parent.edit_suggestions.new({'name': f'{parent.name} published', 'second_field': None})
+            newer.tags.add(tags[1], tags[2])
+        queryset = ParentModel.edit_suggestions.all()
+
+        # can publish only if the condition passes for every edit suggestion
+        with self.assertRaises(PermissionDenied):
+            ParentModel.edit_suggestions.publish_many(queryset, User.objects.get(username='user_simple_1'))
+        self.assertEqual(ParentModel.edit_suggestions.filter(edit_suggestion_status=EditSuggestion.Status.PUBLISHED).count(), 0)
+
+        # select the ids, savepoint, select the parents and the edit suggestions (locked where supported),
+        # tags of the edit suggestions and of the parents, bulk update parents, select/delete/insert tags,
+        # update status, release savepoint
+        with self.assertNumQueries(12):
+            published = ParentModel.edit_suggestions.publish_many(queryset, admin_user)
+        # only the latest edit suggestion of each parent is published, the older ones stay under review
+        self.assertEqual(len(published), 2)
+        self.assertEqual([i.name for i in published], [f'{parent.name} published' for parent in parents])
+        self.assertEqual(
+            list(ParentModel.edit_suggestions.filter(edit_suggestion_status=EditSuggestion.Status.PUBLISHED)
+                 .order_by('pk').values_list('pk', flat=True)),
+            [i.pk for i in published]
+        )
+        self.assertEqual(ParentModel.edit_suggestions.filter(name='older', edit_suggestion_status=0).count(), 2)
+        for parent in ParentModel.objects.all():
+            self.assertTrue(parent.name.endswith('published'))
+            self.assertIsNone(parent.second_field)
+            self.assertEqual(parent.excluded_field, 100)
+            self.assertEqual(list(parent.tags.all()), [tags[1], tags[2]])
+        # already published edit suggestions are skipped
+        self.assertEqual(ParentModel.edit_suggestions.publish_many(queryset.filter(name__endswith='published'), admin_user), [])
+        # only the changed fields are written, like publish
+        parent = parents[0]
+        parent.edit_suggestions.filter(name='older').update(name='renamed', second_field='older')
+        ParentModel.objects.filter(pk=parent.pk).update(second_field='older')
+        with CaptureQueriesContext(connection) as context:
+            ParentModel.edit_suggestions.publish_many(parent.edit_suggestions.filter(name='renamed'), admin_user)
+        updates = [q['sql'] for q in context.captured_queries if q['sql'].startswith('UPDATE "tests_parentmodel"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertNotIn('"second_field"', updates[0])
+        parent = ParentModel.objects.get(pk=parent.pk)
+        self.assertEqual((parent.name, parent.second_field), ('renamed', 'older'))
+        self.assertEqual(list(parent.tags.all()), [tags[2]])
+
+    def test_publish_many_m2m_through_and_foreign(self):
+        admin_user = User.objects.get(is_staff=True)
+        schild = SharedChild.objects.create(name='parent child')
+        echild = SharedChild.objects.create(name='edit child')
+        for name in ['first', 'second']:
+            parent = ParentM2MThroughModel.objects.create(name=name)
+            parent.children.through.objects.create(parent=parent, shared_child=schild, order=1)
+            edited = parent.edit_suggestions.new({'name': f'{name} edited'})
+            edited.children.through.objects.create(parent=edited, shared_child=echild, order=2)
+            edited.children.through.objects.create(parent=edited, shared_child=schild, order=3)
+        ParentM2MThroughModel.edit_suggestions.publish_many(ParentM2MThroughModel.edit_suggestions.all(), admin_user)
+        for parent in ParentM2MThroughModel.objects.all():
+            self.assertTrue(parent.name.endswith('edited'))
+            self.assertEqual(
+                list(parent.children.through.objects.filter(parent=parent).values_list('shared_child', 'order')),
+                [(echild.pk, 2), (schild.pk, 3)]
+            )
+
+        model_with_foreign = ForeignKeyModel.objects.create(name='obj', foreign=schild)
+        model_with_foreign.edit_suggestions.new({'name': 'obj', 'foreign': echild})
+        ForeignKeyModel.edit_suggestions.publish_many(model_with_foreign.edit_suggestions.all(), admin_user)
+        model_with_foreign.refresh_from_db()
+        self.assertEqual(model_with_foreign.foreign, echild)
+
+    def test_publish_many_m2m_self(self):
+        admin_user = User.objects.get(is_staff=True)
+        first, second = ParentM2MSelfModel.objects.all()
+        edited = first.edit_suggestions.new({'name': 'first edited'})
+        edited.children.add(second)
+        ParentM2MSelfModel.edit_suggestions.publish_many(first.edit_suggestions.all(), admin_user)
+        self.assertEqual(list(first.children.all()), [second])
+        self.assertEqual(list(second.children.all()), [])
+
+    def test_status_check_query_count(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent_instance = ParentModel.objects.get(id=1)
+        # creating is a single insert
+        with self.assertNumQueries(1):
+            esi = parent_instance.edit_suggestions.new({'name': 'no extra select'})
+        # the status check doesn't read the row again
+        esi.name = 'edited'
+        with self.assertNumQueries(1):
+            esi.save()
+        loaded = parent_instance.edit_suggestions.get(pk=esi.pk)
+        loaded.name = 'edited again'
+        with self.assertNumQueries(1):
+            loaded.save()
+        # the status is checked once, by the conditional update taking the write lock, in a savepoint
+        with self.assertNumQueries(4):
+            loaded.edit_suggestion_reject(user=admin_user, reason='rejected')
+        # the status is still checked for instances loaded before the change
+        esi.refresh_from_db()
+        with self.assertRaises(PermissionDenied):
+            esi.save()
+        # and falls back to the database when the status isn't loaded
+        deferred = parent_instance.edit_suggestions.only('name').get(pk=esi.pk)
+        with self.assertRaises(PermissionDenied):
+            deferred.save()
+        # a stale instance can't resolve an edit suggestion resolved meanwhile
+        esi = parent_instance.edit_suggestions.new({'name': 'resolved twice'})
+        stale = parent_instance.edit_suggestions.get(pk=esi.pk)
+        esi.edit_suggestion_publish(admin_user)
+        with self.assertRaises(PermissionDenied):
+            stale.edit_suggestion_reject(admin_user, 'no')
+        with self.assertRaises(PermissionDenied):
+            stale.edit_suggestion_publish(admin_user)
+        self.assertEqual(parent_instance.edit_suggestions.get(pk=esi.pk).edit_suggestion_status,
+                         EditSuggestion.Status.PUBLISHED)
+
+    def test_indexes(self):
+        edit_suggestion_model = SimpleParentModel.edit_suggestions.model
+        composite, pending = edit_suggestion_model._meta.indexes
+        self.assertEqual(
+            composite.fields,
+            ['edit_suggestion_parent', 'edit_suggestion_status', '-edit_suggestion_date_created']
+        )
+        self.assertEqual(pending.condition, models.Q(edit_suggestion_status=0))
+        self.assertLessEqual(len(pending.name), 30)
+        # unique for every edit suggestion model
+        self.assertNotEqual(pending.name, ParentModel.edit_suggestions.model._meta.indexes[1].name)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, edit_suggestion_model._meta.db_table)
+        self.assertIn(composite.name, indexes)
+        self.assertIn(pending.name, indexes)
+        # custom indexes replace the default ones and aren't shared between models
+        custom = [models.Index(fields=['edit_suggestion_author'])]
+        edit_suggestion = EditSuggestion(change_status_condition=None, indexes=custom)
+        self.assertEqual([index.fields for index in edit_suggestion.get_indexes(SimpleParentModel)], [['edit_suggestion_author']])
+        self.assertIsNot(edit_suggestion.get_indexes(SimpleParentModel)[0], custom[0])
+
+    def test_publish_supersede(self):
+        admin_user = User.objects.get(is_staff=True)
+        article, other_article = Article.objects.create(title='first'), Article.objects.create(title='second')
+        published, first_sibling, second_sibling = [
+            article.edit_suggestions.new({'title': f'edit {i}'}) for i in range(3)
+        ]
+        other = other_article.edit_suggestions.new({'title': 'other edit'})
+        # status check, parent update and its new version, edit suggestion update and the siblings updated with
+        # a single query, plus the savepoint queries
+        with self.assertNumQueries(7):
+            published.edit_suggestion_publish(admin_user)
+        for sibling in (first_sibling, second_sibling):
+            sibling.refresh_from_db()
+            self.assertEqual(sibling.edit_suggestion_status, EditSuggestion.Status.SUPERSEDED)
+            self.assertEqual(sibling.edit_suggestion_reject_reason, EditSuggestion.SUPERSEDE_REASON)
+            with self.assertRaises(PermissionDenied):
+                sibling.save()
+        other.refresh_from_db()
+        self.assertEqual(other.edit_suggestion_status, EditSuggestion.Status.UNDER_REVIEWS)
+        self.assertEqual(article.edit_suggestions.pending_count(), 0)
+
+    def test_publish_many_supersede(self):
+        admin_user = User.objects.get(is_staff=True)
+        edit_suggestion = Article.edit_suggestions.model._meta.edit_suggestion
+        article, other_article = Article.objects.create(title='first'), Article.objects.create(title='second')
+        first = article.edit_suggestions.new({'title': 'first edit'})
+        second = other_article.edit_suggestions.new({'title': 'second edit'})
+        sibling = article.edit_suggestions.new({'title': 'sibling edit'})
+        edit_suggestion.on_publish_supersede = 'reject'
+        try:
+            Article.edit_suggestions.publish_many(Article.edit_suggestions.filter(pk__in=[first.pk, second.pk]), admin_user)
+        finally:
+            edit_suggestion.on_publish_supersede = 'supersede'
+        sibling.refresh_from_db()
+        self.assertEqual(sibling.edit_suggestion_status, EditSuggestion.Status.REJECTED)
+        first.refresh_from_db()
+        self.assertEqual(first.edit_suggestion_status, EditSuggestion.Status.PUBLISHED)
+        with self.assertRaises(ValueError):
+            EditSuggestion(change_status_condition=None, on_publish_supersede='delete')
+
+    def test_version_conflict(self):
+        admin_user = User.objects.get(is_staff=True)
+        article = Article.objects.create(title='first')
+        self.assertEqual(article.version, 0)
+        old = article.edit_suggestions.new({'title': 'old edit'})
+        self.assertEqual(old.edit_suggestion_base_version, 0)
+        self.assertNotIn('version', Article.edit_suggestions.get_tracked_fields()[0])
+        # the parent changed after the edit suggestion was made
+        article.body = 'changed'
+        article.save()
+        self.assertEqual(Article.objects.get(pk=article.pk).version, 1)
+        current = article.edit_suggestions.new({'title': 'current edit'})
+        self.assertEqual(current.edit_suggestion_base_version, 1)
+        # filtered in the database, without loading the parents
+        with self.assertNumQueries(1):
+            self.assertEqual(list(article.edit_suggestions.applicable()), [current])
+        old = article.edit_suggestions.get(pk=old.pk)
+        with self.assertRaises(EditSuggestionConflictError):
+            old.edit_suggestion_publish(admin_user)
+        with self.assertRaises(EditSuggestionConflictError):
+            Article.edit_suggestions.publish_many(Article.edit_suggestions.filter(pk=old.pk), admin_user)
+        current.edit_suggestion_publish(admin_user)
+        article.refresh_from_db()
+        self.assertEqual((article.title, article.version), ('current edit', 2))
+        self.assertEqual(list(article.edit_suggestions.applicable()), [])
+        # publish_many bumps the versions too
+        latest = article.edit_suggestions.new({'title': 'latest edit'})
+        Article.edit_suggestions.publish_many(Article.edit_suggestions.filter(pk=latest.pk), admin_user)
+        article.refresh_from_db()
+        self.assertEqual((article.title, article.version), ('latest edit', 3))
+        # made before version_field was set: the version is unknown, not a conflict
+        unversioned = article.edit_suggestions.new({'title': 'unversioned edit'})
+        Article.edit_suggestions.filter(pk=unversioned.pk).update(edit_suggestion_base_version=None)
+        self.assertEqual(list(article.edit_suggestions.applicable()), [unversioned])
+        unversioned = article.edit_suggestions.get(pk=unversioned.pk)
+        unversioned.edit_suggestion_publish(admin_user)
+        article.refresh_from_db()
+        self.assertEqual(article.title, 'unversioned edit')
+        # the version is bumped in the UPDATE, a stale instance doesn't lose the other save
+        stale = Article.objects.get(pk=article.pk)
+        article.save()
+        stale.save()
+        self.assertEqual((article.version, stale.version), (5, 6))
+        stale.save(update_fields=['title'])
+        self.assertEqual(Article.objects.get(pk=article.pk).version, 6)
+
+    def test_three_way_merge(self):
+        admin_user = User.objects.get(is_staff=True)
+        tag_1, tag_2, tag_3 = Tag.objects.all()
+        page = WikiPage.objects.create(title='title', body='body')
+        page.tags.add(tag_1)
+        title_edit = page.edit_suggestions.new({'title': 'new title', 'body': 'body'})
+        title_edit.tags.add(tag_1)
+        self.assertEqual(title_edit.edit_suggestion_base, {'title': 'title', 'body': 'body', 'tags': [tag_1.pk]})
+        body_edit = page.edit_suggestions.new({'title': 'title', 'body': 'new body'})
+        body_edit.tags.add(tag_1)
+        tags_edit = page.edit_suggestions.new({'title': 'title', 'body': 'body'})
+        tags_edit.tags.add(tag_2)
+        other_title_edit = page.edit_suggestions.new({'title': 'other title', 'body': 'body'})
+        other_title_edit.tags.add(tag_1)
+        title_edit.edit_suggestion_publish(admin_user)
+        # disjoint changes don't overwrite each other
+        body_edit.edit_suggestion_publish(admin_user)
+        tags_edit.edit_suggestion_publish(admin_user)
+        page.refresh_from_db()
+        self.assertEqual((page.title, page.body), ('new title', 'new body'))
+        self.assertEqual(list(page.tags.all()), [tag_2])
+        # the title changed since the edit suggestion was made
+        self.assertEqual(other_title_edit.get_merge(), ({}, ['title']))
+        with self.assertRaises(EditSuggestionConflictError) as raised:
+            other_title_edit.edit_suggestion_publish(admin_user)
+        self.assertEqual(raised.exception.fields, ['title'])
+        page.refresh_from_db()
+        self.assertEqual(page.title, 'new title')
+        # publish_many merges too
+        page = WikiPage.objects.create(title='title', body='body')
+        title_edit = page.edit_suggestions.new({'title': 'new title', 'body': 'body'})
+        body_edit = page.edit_suggestions.new({'title': 'title', 'body': 'new body'})
+        other_body_edit = page.edit_suggestions.new({'title': 'title', 'body': 'other body'})
+        body_edit.edit_suggestion_publish(admin_user)
+        WikiPage.edit_suggestions.publish_many(WikiPage.edit_suggestions.filter(pk=title_edit.pk), admin_user)
+        page.refresh_from_db()
+        self.assertEqual((page.title, page.body), ('new title', 'new body'))
+        with self.assertRaises(EditSuggestionConflictError) as raised:
+            WikiPage.edit_suggestions.publish_many(WikiPage.edit_suggestions.filter(pk=other_body_edit.pk), admin_user)
+        self.assertEqual(raised.exception.fields, ['body'])
+        page.refresh_from_db()
+        self.assertEqual(page.body, 'new body')
+
+    def test_auto_publish(self):
+        admin_user = User.objects.get(is_staff=True)
+        first, second = WikiPage.objects.create(title='first'), WikiPage.objects.create(title='second')
+        WikiPage.edit_suggestions.bulk_new([
+            (first, {'title': 'first', 'body': 'first body'}),
+            (first, {'title': 'first title', 'body': ''}),
+            (second, {'title': 'second title', 'body': ''}),
+            (second, {'title': 'second other title', 'body': ''}),
+        ])
+        for edit in WikiPage.edit_suggestions.all():
+            self.assertEqual(edit.edit_suggestion_base['title'], edit.edit_suggestion_parent.title)
+        published, conflicting = WikiPage.edit_suggestions.auto_publish(WikiPage.edit_suggestions.all(), admin_user)
+        self.assertEqual(len(published), 3)
+        self.assertEqual([e.title for e in conflicting], ['second other title'])
+        first.refresh_from_db()
+        self.assertEqual((first.title, first.body), ('first title', 'first body'))
+        self.assertEqual(WikiPage.edit_suggestions.pending_count(), 1)
+
+    def test_status_counters(self):
+        admin_user = User.objects.get(is_staff=True)
+        counter_model = WikiPage.edit_suggestions.model._meta.edit_suggestion.counter_model
+        first, second = WikiPage.objects.create(title='first'), WikiPage.objects.create(title='second')
+        published = first.edit_suggestions.new({'title': 'first edit'})
+        rejected = first.edit_suggestions.new({'title': 'first other edit'})
+        deleted = first.edit_suggestions.new({'title': 'deleted edit'})
+        WikiPage.edit_suggestions.bulk_new([
+            (second, {'title': 'second edit'}),
+            (second, {'title': 'second', 'body': 'second body'}),
+            (second, {'title': 'second other edit'}),
+        ])
+        self.assertEqual(WikiPage.edit_suggestions.pending_counts([first, second]), {first.pk: 3, second.pk: 3})
+        # the m2m snapshot of three_way_merge, the insert and the update of the counter
+        with self.assertNumQueries(3):
+            first.edit_suggestions.new({'title': 'first edit again'})
+        published.edit_suggestion_publish(admin_user)
+        rejected.edit_suggestion_reject(admin_user, 'no')
+        deleted.delete()
+        to_publish = second.edit_suggestions.order_by('pk').values_list('pk', flat=True)[:2]
+        # only the latest of the two gets published
+        WikiPage.edit_suggestions.publish_many(WikiPage.edit_suggestions.filter(pk__in=list(to_publish)), admin_user)
+        WikiPage.edit_suggestions.publish_many(WikiPage.edit_suggestions.filter(pk=to_publish[0]), admin_user)
+        # one query for all the parents
+        with self.assertNumQueries(1):
+            counts = WikiPage.edit_suggestions.pending_counts([first.pk, second.pk])
+        self.assertEqual(counts, {first.pk: 1, second.pk: 1})
+        self.assertEqual(second.edit_suggestions.pending_count(), 1)
+        counts = dict(counter_model.objects.filter(parent=first).values_list('status', 'count'))
+        self.assertEqual(counts, {0: 1, 1: 1, 2: 1})
+        # repair
+        counter_model.objects.update(count=100)
+        out = io.StringIO()
+        call_command('rebuild_edit_suggestion_counters', 'tests.WikiPage', stdout=out)
+        self.assertIn('tests.WikiPage', out.getvalue())
+        self.assertEqual(WikiPage.edit_suggestions.pending_counts([first, second]), {first.pk: 1, second.pk: 1})
+        self.assertEqual(counter_model.objects.get(parent=second, status=1).count, 2)
+        # purged edit suggestions are subtracted once
+        self.assertEqual(WikiPage.edit_suggestions.archive_resolved(timezone.now(), purge=True), 4)
+        counts = dict(counter_model.objects.filter(parent=first).values_list('status', 'count'))
+        self.assertEqual(counts, {0: 1, 1: 0, 2: 0})
+        counts = dict(counter_model.objects.filter(parent=second).values_list('status', 'count'))
+        self.assertEqual(counts, {0: 1, 1: 0})
+        self.assertEqual(WikiPage.edit_suggestions.pending_counts([first, second]), {first.pk: 1, second.pk: 1})
+        # the counters are deleted with the parent
+        first.delete()
+        self.assertFalse(counter_model.objects.filter(parent_id=first.pk).exists())
+        # without counters the same query groups the edit suggestions
+        self.assertEqual(ParentModel.edit_suggestions.pending_counts([1, 2]), {1: 0, 2: 0})
+
+    def test_prefetch_edit_suggestions(self):
+        admin_user = User.objects.get(is_staff=True)
+        for parent in SimpleParentModel.objects.all():
+            for i in range(4):
+                parent.edit_suggestions.new({'name': f'{parent.name} edit {i}'})
+        rejected = SimpleParentModel.objects.get(pk=1).edit_suggestions.order_by('pk').first()
+        rejected.edit_suggestion_reject(admin_user, 'no')
+        with self.assertNumQueries(2):
+            parents = prefetch_edit_suggestions(SimpleParentModel.objects.order_by('pk'), status=0, limit_per_parent=2)
+            names = [[e.name for e in parent.edit_suggestions.all()] for parent in parents]
+            # the parent is set on the edit suggestions
+            self.assertEqual(parents[0].edit_suggestions.all()[0].edit_suggestion_parent.name, 'simple parent 1')
+        self.assertEqual(names, [
+            ['simple parent 1 edit 3', 'simple parent 1 edit 2'],
+            ['simple parent 2 edit 3', 'simple parent 2 edit 2'],
+        ])
+        with self.assertNumQueries(1):
+            parents = prefetch_edit_suggestions(list(parents))
+            self.assertEqual([len(parent.edit_suggestions.all()) for parent in parents], [4, 4])
+            self.assertEqual(parents[0].edit_suggestions.all().count(), 4)
+        # filtering queries the database, creating one clears the cache
+        self.assertEqual(parents[0].edit_suggestions.filter(edit_suggestion_status=0).count(), 3)
+        parents[0].edit_suggestions.new({'name': 'new edit'})
+        self.assertEqual(parents[0].edit_suggestions.all().count(), 5)
+
+    def test_status_summary(self):
+        cache.clear()
+        admin_user = User.objects.get(is_staff=True)
+        first, second = SimpleParentModel.objects.all()
+        for i in range(3):
+            first.edit_suggestions.new({'name': f'edit {i}'})
+        first.edit_suggestions.first().edit_suggestion_publish(admin_user)
+        first.edit_suggestions.filter(edit_suggestion_status=0).first().edit_suggestion_reject(admin_user, 'no')
+        second.edit_suggestions.new({'name': 'second edit'})
+        with self.assertNumQueries(1):
+            summary = SimpleParentModel.edit_suggestions.status_summary([first, second.pk], cache_timeout=60)
+        self.assertEqual(summary, {
+            first.pk: {0: 1, 1: 1, 2: 1, 3: 0},
+            second.pk: {0: 1, 1: 0, 2: 0, 3: 0},
+        })
+        # served from the cache until it expires
+        second.edit_suggestions.new({'name': 'second edit again'})
+        with self.assertNumQueries(0):
+            self.assertEqual(SimpleParentModel.edit_suggestions.status_summary([second], cache_timeout=60), {
+                second.pk: {0: 1, 1: 0, 2: 0, 3: 0},
+            })
+        self.assertEqual(SimpleParentModel.edit_suggestions.status_summary([second])[second.pk][0], 2)
+        # from the counters
+        page = WikiPage.objects.create(title='page')
+        page.edit_suggestions.new({'title': 'page edit'})
+        with self.assertNumQueries(1):
+            self.assertEqual(WikiPage.edit_suggestions.status_summary([page])[page.pk][0], 1)
+
+    def test_archive_resolved(self):
+        admin_user = User.objects.get(is_staff=True)
+        child = SharedChild.objects.create(name='child')
+        parent = ParentM2MThroughModel.objects.create(name='parent')
+        edits = [parent.edit_suggestions.new({'name': f'edit {i}'}) for i in range(5)]
+        for edit in edits:
+            edit.children.through.objects.create(parent=edit, shared_child=child, order=edit.pk)
+        for edit in edits[:3]:
+            edit.edit_suggestion_reject(admin_user, 'no')
+        pending_ids = [edits[3].pk, edits[4].pk]
+        edit_through = edits[0].children.through
+        # nothing older than the cutoff
+        self.assertEqual(ParentM2MThroughModel.edit_suggestions.archive_resolved(timezone.now() - datetime.timedelta(days=1)), 0)
+        out = io.StringIO()
+        with self.assertNumQueries(1 + 2 * 7):
+            # for each chunk: select, m2m snapshot, insert, delete m2m, delete and savepoints. one select ends the loop
+            call_command('archive_edit_suggestions', 'tests.ParentM2MThroughModel', '--days', '0', '--chunk-size', '2',
+                         stdout=out)
+        self.assertIn('3 archived', out.getvalue())
+        self.assertEqual(list(parent.edit_suggestions.values_list('pk', flat=True).order_by('pk')), pending_ids)
+        self.assertEqual(list(edit_through.objects.values_list('parent_id', flat=True).order_by('parent_id')), pending_ids)
+        archive_model = ParentM2MThroughModel.edit_suggestions.model._meta.edit_suggestion.archive_model
+        archived = archive_model.objects.get(edit_suggestion_id=edits[0].pk)
+        self.assertEqual(archived.edit_suggestion_status, EditSuggestion.Status.REJECTED)
+        self.assertEqual(archived.edit_suggestion_reject_reason, 'no')
+        self.assertEqual(archived.edit_suggestion_data, {'name': 'edit 0', 'children': [[child.pk, edits[0].pk]]})
+        # purge works without the archive model
+        parent_model = ParentModel.objects.get(pk=1)
+        rejected = parent_model.edit_suggestions.new({'name': 'rejected'})
+        rejected.tags.add(Tag.objects.get(pk=1))
+        rejected.edit_suggestion_reject(admin_user, 'no')
+        with self.assertRaises(ImproperlyConfigured):
+            ParentModel.edit_suggestions.archive_resolved(timezone.now())
+        self.assertEqual(ParentModel.edit_suggestions.archive_resolved(timezone.now(), purge=True), 1)
+        self.assertFalse(rejected.tags.through.objects.filter(**{rejected.tags.source_field_name: rejected.pk}).exists())
+
+    def test_export(self):
+        tag = Tag.objects.get(pk=1)
+        parent = ParentModel.objects.get(pk=1)
+        edits = [parent.edit_suggestions.new({'name': f'edit {i}', 'second_field': 'value'}) for i in range(3)]
+        edits[1].tags.add(tag)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.jsonl.gz')
+            # the edit suggestions and the m2m ids of each chunk
+            with self.assertNumQueries(1 + 2):
+                call_command('export_edit_suggestions', 'tests.ParentModel', '--output', path, '--chunk-size', '2',
+                             stderr=io.StringIO())
+            with gzip.open(path, 'rt') as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual([line['id'] for line in lines], [edit.pk for edit in edits])
+            self.assertEqual(lines[1]['model'], 'tests.ParentModel')
+            self.assertEqual(lines[1]['parent_id'], parent.pk)
+            self.assertEqual(lines[1]['fields'], {'name': 'edit 1', 'second_field': 'value', 'tags': [tag.pk]})
+        # resume after the last exported primary key
+        out = io.StringIO()
+        err = io.StringIO()
+        call_command('export_edit_suggestions', 'tests.ParentModel', '--after-pk', str(edits[1].pk), stdout=out,
+                     stderr=err)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()], [edits[2].pk])
+        self.assertIn(f'1 exported, last pk {edits[2].pk}', err.getvalue())
+
+    def test_async(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent = ParentModel.objects.get(pk=1)
+        tag = Tag.objects.create(name='async tag')
+
+        async def create_and_publish():
+            first = await parent.edit_suggestions.anew({'name': 'first async edit'})
+            second = await parent.edit_suggestions.anew({'name': 'second async edit'}, {'tags': [tag.pk]})
+            delta = await first.adiff_against_parent()
+            await first.edit_suggestion_apublish(admin_user)
+            await second.edit_suggestion_areject(admin_user, 'no')
+            names = [edit.name async for edit in parent.edit_suggestions.aiterator(chunk_size=1)]
+            all_names = [edit.name async for edit in ParentModel.edit_suggestions]
+            return delta, names, all_names
+
+        delta, names, all_names = async_to_sync(create_and_publish)()
+        self.assertIn('name', delta.changed_fields)
+        self.assertEqual(sorted(names), ['first async edit', 'second async edit'])
+        self.assertEqual(sorted(all_names), ['first async edit', 'second async edit'])
+        parent.refresh_from_db()
+        self.assertEqual(parent.name, 'first async edit')
+        self.assertEqual(
+            list(parent.edit_suggestions.order_by('pk').values_list('edit_suggestion_status', flat=True)),
+            [EditSuggestion.Status.PUBLISHED, EditSuggestion.Status.REJECTED]
+        )
+        self.assertEqual(list(parent.edit_suggestions.get(name='second async edit').tags.all()), [tag])
+
+    def test_request_middleware(self):
+        user = User.objects.get(username='user_simple_1')
+        parent = SimpleParentModel.objects.get(pk=1)
+        request = RequestFactory().get('/')
+        request.user = user
+
+        def view(request):
+            self.assertIs(get_current_request(), request)
+            self.assertIs(EditSuggestion.thread.request, request)
+            # the author defaults to the user of the request
+            return parent.edit_suggestions.new({'name': 'edit in a request'})
+
+        edited = EditSuggestionRequestMiddleware(view)(request)
+        self.assertEqual(edited.edit_suggestion_author, user)
+        self.assertIsNone(get_current_request())
+        self.assertFalse(hasattr(EditSuggestion.thread, 'request'))
+        self.assertIsNone(parent.edit_suggestions.new({'name': 'edit outside a request'}).edit_suggestion_author)
+
+        async def async_view(request):
+            await asyncio.sleep(0)
+            return get_current_user()
+
+        other_request = RequestFactory().get('/')
+        other_request.user = User.objects.get(username='user_simple_2')
+
+        async def concurrent_requests():
+            middleware = EditSuggestionRequestMiddleware(async_view)
+            # each coroutine sees its own request
+            return await asyncio.gather(middleware(request), middleware(other_request))
+
+        self.assertTrue(asyncio.iscoroutinefunction(EditSuggestionRequestMiddleware(async_view)))
+        users = async_to_sync(concurrent_requests)()
+        self.assertEqual([u.username for u in users], ['user_simple_1', 'user_simple_2'])
+
+    def test_deferred_hooks(self):
+        class RecordingExecutor(object):
+            def __init__(self):
+                self.tasks = []
+
+            def submit(self, fn, *args):
+                self.tasks.append((fn, args))
+
+        admin_user = User.objects.get(is_staff=True)
+        edit_suggestion = SimpleParentModel.edit_suggestions.model._meta.edit_suggestion
+        executor = RecordingExecutor()
+        edit_suggestion.defer_hooks = True
+        edit_suggestion.hook_executor = executor
+        try:
+            first = SimpleParentModel.objects.first()
+            published = first.edit_suggestions.new({'name': 'published'})
+            rejected = first.edit_suggestions.new({'name': 'rejected'})
+            batch_parents = [SimpleParentModel.objects.create(name=f'batch parent {i}') for i in range(3)]
+            batch = [parent.edit_suggestions.new({'name': f'batch {i}'}) for i, parent in enumerate(batch_parents)]
+            commit_callbacks = len(connection.run_on_commit)
+            published.edit_suggestion_publish(admin_user)
+            rejected.edit_suggestion_reject(admin_user, 'no')
+            SimpleParentModel.edit_suggestions.publish_many(
+                SimpleParentModel.edit_suggestions.filter(pk__in=[e.pk for e in batch]), admin_user
+            )
+            # nothing runs before the commit
+            self.assertEqual(User.objects.get(pk=admin_user.pk).username, 'user_admin')
+            self.assertEqual(executor.tasks, [])
+            callbacks = connection.run_on_commit[commit_callbacks:]
+            # one for each operation, the bulk publish is a single batch
+            self.assertEqual(len(callbacks), 3)
+            for sids, callback in callbacks:
+                callback()
+        finally:
+            edit_suggestion.defer_hooks = False
+            edit_suggestion.hook_executor = None
+        self.assertEqual(len(executor.tasks), 3)
+        self.assertEqual([len(args[1]) for fn, args in executor.tasks], [1, 1, 3])
+        self.assertEqual(sorted(instance.pk for instance, user in executor.tasks[2][1][1]), [e.pk for e in batch])
+        fn, args = executor.tasks[1]
+        fn(*args)
+        self.assertEqual(User.objects.get(pk=admin_user.pk).username, 'rejected')
+
+    def test_review_queue(self):
+        admin_user = User.objects.get(is_staff=True)
+        other_user = User.objects.get(username='user_simple_1')
+        foreign = SharedChild.objects.create(name='foreign')
+        parent = ForeignKeyModel.objects.create(name='obj', foreign=foreign)
+        suggestions = [parent.edit_suggestions.new({'name': f'edit {i}', 'foreign': foreign}) for i in range(5)]
+        suggestions[4].edit_suggestion_reject(admin_user, 'no')
+        first = ForeignKeyModel.edit_suggestions.claim(admin_user, count=2)
+        second = ForeignKeyModel.edit_suggestions.claim(other_user, count=5)
+        # oldest first, never twice, the rejected one is not claimable
+        self.assertEqual([e.pk for e in first], [e.pk for e in suggestions[:2]])
+        self.assertEqual([e.pk for e in second], [e.pk for e in suggestions[2:4]])
+        self.assertEqual(ForeignKeyModel.edit_suggestions.claim(admin_user), [])
+        self.assertEqual(first[0].edit_suggestion_claimed_by, admin_user)
+        # expired claims can be taken again
+        ForeignKeyModel.edit_suggestions.filter(pk=first[0].pk).update(
+            edit_suggestion_claimed_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual([e.pk for e in ForeignKeyModel.edit_suggestions.claim(other_user)], [first[0].pk])
+        self.assertEqual(parent.edit_suggestions.release(other_user), 3)
+        self.assertEqual([e.pk for e in parent.edit_suggestions.claim(admin_user, count=5)],
+                         [suggestions[0].pk, suggestions[2].pk, suggestions[3].pk])
+        with self.assertRaises(ImproperlyConfigured):
+            SimpleParentModel.edit_suggestions.claim(admin_user)
+
+    def test_deduplicate(self):
+        admin_user = User.objects.get(is_staff=True)
+        first_child = SharedChild.objects.create(name='first')
+        second_child = SharedChild.objects.create(name='second')
+        parent = ParentM2MThroughModel.objects.create(name='parent')
+        children = [{'pk': first_child.pk, 'order': 1}, {'pk': second_child.pk, 'order': 2}]
+        edited = parent.edit_suggestions.new({'name': 'edited'}, {'children': children})
+        self.assertEqual(
+            list(edited.children.through.objects.filter(parent=edited).values_list('shared_child', 'order')),
+            [(first_child.pk, 1), (second_child.pk, 2)]
+        )
+        # one lookup on the content hash, m2m order doesn't matter
+        with self.assertNumQueries(1):
+            duplicate = parent.edit_suggestions.new({'name': 'edited'}, {'children': children[::-1]})
+        self.assertEqual(duplicate.pk, edited.pk)
+        self.assertTrue(duplicate.edit_suggestion_merged)
+        other = parent.edit_suggestions.new({'name': 'edited'}, {'children': [{'pk': first_child.pk, 'order': 3}]})
+        self.assertNotEqual(other.pk, edited.pk)
+        self.assertEqual(parent.edit_suggestions.count(), 2)
+        edit_suggestion = ParentM2MThroughModel.edit_suggestions.model._meta.edit_suggestion
+        edit_suggestion.deduplicate = 'reject'
+        try:
+            with self.assertRaises(EditSuggestionDuplicateError) as raised:
+                parent.edit_suggestions.new({'name': 'edited'}, {'children': children})
+        finally:
+            edit_suggestion.deduplicate = 'merge'
+        self.assertEqual(raised.exception.duplicate.pk, edited.pk)
+        # a concurrent request inserting the same content is stopped by the unique constraint
+        content_hash = ParentM2MThroughModel.edit_suggestions.get(pk=edited.pk).edit_suggestion_content_hash
+        concurrent = parent.edit_suggestions.new({'name': 'edited', 'edit_suggestion_content_hash': content_hash})
+        self.assertEqual(concurrent.pk, edited.pk)
+        self.assertTrue(concurrent.edit_suggestion_merged)
+        # bulk_new skips the duplicates
+        created = ParentM2MThroughModel.edit_suggestions.bulk_new([
+            (parent, {'name': 'edited'}, {'children': children}),
+            (parent, {'name': 'bulk'}, {}),
+            (parent, {'name': 'bulk'}, {}),
+        ])
+        self.assertEqual(created, 1)
+        self.assertEqual(parent.edit_suggestions.count(), 3)
+        # without m2m_data the children are added afterwards, not deduplicated
+        without_m2m = parent.edit_suggestions.new({'name': 'same'})
+        without_m2m.children.through.objects.create(parent=without_m2m, shared_child=first_child, order=1)
+        self.assertNotEqual(parent.edit_suggestions.new({'name': 'same'}).pk, without_m2m.pk)
+        # edited after creation, not a duplicate of its original content anymore
+        original = parent.edit_suggestions.new({'name': 'original'}, {})
+        original.name = 'changed'
+        original.save()
+        self.assertIsNone(ParentM2MThroughModel.edit_suggestions.get(pk=original.pk).edit_suggestion_content_hash)
+        self.assertNotEqual(parent.edit_suggestions.new({'name': 'original'}, {}).pk, original.pk)
+        original = parent.edit_suggestions.new({'name': 'original again'}, {})
+        original.name = 'changed again'
+        original.save(update_fields=['name'])
+        self.assertNotEqual(parent.edit_suggestions.new({'name': 'original again'}, {}).pk, original.pk)
+        # only the ones under review are duplicates
+        edited.edit_suggestion_reject(admin_user, 'no')
+        self.assertNotEqual(parent.edit_suggestions.new({'name': 'edited'}, {'children': children}).pk, edited.pk)
+        with self.assertRaises(ValueError):
+            EditSuggestion(change_status_condition=None, deduplicate='drop')
+
+    def test_deduplicate_sparse_storage(self):
+        tag = Tag.objects.get(pk=1)
+        note = SparseNote.objects.create(title='title')
+        edited = note.edit_suggestions.new({'title': 'edited', 'category': tag})
+        duplicate = note.edit_suggestions.new({'title': 'edited', 'category_id': str(tag.pk)})
+        self.assertEqual(duplicate.pk, edited.pk)
+        self.assertTrue(duplicate.edit_suggestion_merged)
+        self.assertNotEqual(note.edit_suggestions.new({'title': 'edited'}).pk, edited.pk)
+
+    def test_instrumentation(self):
+        admin_user = User.objects.get(is_staff=True)
+        parent = ParentModel.objects.get(pk=1)
+        label = ParentModel.edit_suggestions.model._meta.label
+        collector = instrumentation.InMemoryCollector()
+        instrumentation.set_collector(collector)
+        try:
+            edits = [parent.edit_suggestions.new({'name': f'edit {i}'}) for i in range(3)]
+            edits[0].diff_against_parent()
+            edits[0].edit_suggestion_publish(admin_user)
+            edits[1].edit_suggestion_reject(admin_user, 'no')
+            with self.assertRaises(PermissionDenied):
+                edits[2].edit_suggestion_publish(User.objects.get(username='user_simple_1'))
+        finally:
+            instrumentation.set_collector(None)
+        stats = collector.stats()
+        self.assertEqual(set(stats), {(operation, label) for operation in ('new', 'diff', 'publish', 'reject')})
+        self.assertEqual(stats[('new', label)]['count'], 3)
+        # insert of each edit suggestion
+        self.assertEqual(stats[('new', label)]['queries_max'], 1)
+        self.assertEqual(stats[('new', label)]['rows'], 3)
+        self.assertEqual(stats[('publish', label)]['count'], 2)
+        self.assertEqual(stats[('publish', label)]['errors'], 1)
+        # the status check and the update, with the savepoint queries
+        self.assertEqual(stats[('reject', label)]['queries'], 4)
+        self.assertGreater(stats[('diff', label)]['duration_p50'], 0)
+        # disabled
+        parent.edit_suggestions.new({'name': 'not measured'})
+        self.assertEqual(collector.stats()[('new', label)]['count'], 3)
+        self.assertEqual(instrumentation.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(instrumentation.percentile([1, 2, 3, 4], 99), 4)
+        # odd integer ranks
+        self.assertEqual(instrumentation.percentile(list(range(1, 11)), 50), 5)
+        self.assertEqual(instrumentation.percentile(list(range(1, 11)), 90), 9)
+        self.assertEqual(instrumentation.percentile(list(range(1, 7)), 50), 3)
+        self.assertEqual(instrumentation.percentile([7], 1), 7)
@@ -0,0 +1,252 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from ..models import SimpleParentModel, Tag, ParentModel, ParentM2MSelfModel, SharedChild, ParentM2MThroughModel, \
+    ForeignKeyModel
+
+# number of queries of each operation by model. tests run in a transaction so atomic blocks add a SAVEPOINT and
+# a RELEASE SAVEPOINT query. every operation is run with 1 and 5 m2m values, the count must be the same
+BUDGETS = {
+    # insert, plus the m2m inserts in a savepoint. the through model looks for a duplicate first
+    'new': {
+        SimpleParentModel: 1,
+        ParentModel: 4,
+        ParentM2MSelfModel: 4,
+        ParentM2MThroughModel: 5,
+        ForeignKeyModel: 1,
+    },
+    # parent, m2m of the edit suggestion and of the parent
+    'diff': {
+        SimpleParentModel: 1,
+        ParentModel: 3,
+        ParentM2MSelfModel: 3,
+        ParentM2MThroughModel: 3,
+        ForeignKeyModel: 1,
+    },
+    # status check in a savepoint, parent, parent update and edit suggestion update, plus reading, deleting and
+    # inserting the changed m2m. post_publish of the simple model saves the user
+    'publish': {
+        SimpleParentModel: 7,
+        ParentModel: 11,
+        ParentM2MSelfModel: 11,
+        ParentM2MThroughModel: 10,
+        ForeignKeyModel: 6,
+    },
+    # status check and edit suggestion update in a savepoint. post_reject of the simple model saves the user
+    'reject': {
+        SimpleParentModel: 5,
+        ParentModel: 4,
+        ParentM2MSelfModel: 4,
+        ParentM2MThroughModel: 4,
+        ForeignKeyModel: 4,
+    },
+}
+
+# ModelViewsetWithEditSuggestion actions, by url basename
+REST_BUDGETS = {
+    # parent, edit suggestions
+    'edit-suggestions': {
+        'parent-viewset': 2,
+    },
+    # parent, new (m2m added by the viewset) and serialization. the through model looks for a duplicate
+    # and inserts in a savepoint
+    'edit-suggestion-create': {
+        'parent-viewset': 5,
+        'm2m-through-viewset': 8,
+        'foreign-viewset': 3,
+    },
+    # parent, edit suggestion and publish, the parent is not loaded again
+    'edit-suggestion-publish': {
+        'parent-viewset': 12,
+        'm2m-through-viewset': 11,
+        'foreign-viewset': 7,
+    },
+    # parent, edit suggestion and reject
+    'edit-suggestion-reject': {
+        'parent-viewset': 6,
+        'm2m-through-viewset': 6,
+        'foreign-viewset': 6,
+    },
+}
+
+REST_MODELS = {
+    'parent-viewset': ParentModel,
+    'm2m-through-viewset': ParentM2MThroughModel,
+    'foreign-viewset': ForeignKeyModel,
+}
+
+
+class QueryBudgetTest(APITestCase):
+    """
+    Pins the number of queries of the public operations, an extra query or a N+1 on m2m fails here.
+    When an operation changes on purpose update its budget
+    """
+
+    def setUp(self):
+        self.admin_user = User.objects.create(username='admin', is_staff=True)
+        self.tags = [Tag.objects.create(name=f'tag {i}') for i in range(10)]
+        self.children = [SharedChild.objects.create(name=f'child {i}') for i in range(10)]
+        self.self_children = [ParentM2MSelfModel.objects.create(name=f'child {i}') for i in range(10)]
+
+    def assertQueryBudget(self, budget, prepare, sizes=(1, 5)):
+        """
+        ``prepare(size)`` sets up the data with ``size`` m2m values and returns the operation to run
+        """
+        for size in sizes:
+            operation = prepare(size)
+            with CaptureQueriesContext(connection) as context:
+                operation()
+            queries = [query['sql'] for query in context.captured_queries]
+            self.assertEqual(
+                len(queries), budget,
+                '{} queries instead of {} with {} m2m values:\n{}'.format(len(queries), budget, size, '\n'.join(queries))
+            )
+
+    def create_parent(self, model, size):
+        if model is ParentModel:
+            parent = model.objects.create(name='parent', excluded_field=0)
+            parent.tags.set(self.tags[:size])
+        elif model is ParentM2MSelfModel:
+            parent = model.objects.create(name='parent')
+            parent.children.set(self.self_children[:size])
+        elif model is ParentM2MThroughModel:
+            parent = model.objects.create(name='parent')
+            for order, child in enumerate(self.children[:size]):
+                parent.children.through.objects.create(parent=parent, shared_child=child, order=order)
+        elif model is ForeignKeyModel:
+            parent = model.objects.create(name='parent', foreign=self.children[0])
+        else:
+            parent = model.objects.create(name='parent')
+        # fresh instance, nothing cached
+        return model.objects.get(pk=parent.pk)
+
+    def edit_data(self, model, size):
+        """Edit suggestion data and m2m data, different from the parent"""
+        if model is ParentModel:
+            return {'name': 'edited'}, {'tags': [tag.pk for tag in self.tags[-size:]]}
+        if model is ParentM2MSelfModel:
+            return {'name': 'edited'}, {'children': [child.pk for child in self.self_children[-size:]]}
+        if model is ParentM2MThroughModel:
+            return {'name': 'edited'}, {
+                'children': [{'pk': child.pk, 'order': order} for order, child in enumerate(self.children[-size:])]
+            }
+        if model is ForeignKeyModel:
+            return {'name': 'edited', 'foreign': self.children[1]}, None
+        return {'name': 'edited'}, None
+
+    def create_edit_suggestion(self, model, size):
+        parent = self.create_parent(model, size)
+        data, m2m_data = self.edit_data(model, size)
+        edit_suggestion = parent.edit_suggestions.new(data, m2m_data)
+        return model.edit_suggestions.get(pk=edit_suggestion.pk)
+
+    def test_new(self):
+        for model, budget in BUDGETS['new'].items():
+            with self.subTest(model=model.__name__):
+                def prepare(size):
+                    parent = self.create_parent(model, size)
+                    data, m2m_data = self.edit_data(model, size)
+                    return lambda: parent.edit_suggestions.new(data, m2m_data)
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_diff(self):
+        for model, budget in BUDGETS['diff'].items():
+            with self.subTest(model=model.__name__):
+                def prepare(size):
+                    edit_suggestion = self.create_edit_suggestion(model, size)
+                    return edit_suggestion.diff_against_parent
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_publish(self):
+        for model, budget in BUDGETS['publish'].items():
+            with self.subTest(model=model.__name__):
+                def prepare(size):
+                    edit_suggestion = self.create_edit_suggestion(model, size)
+                    return lambda: edit_suggestion.edit_suggestion_publish(self.admin_user)
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_reject(self):
+        for model, budget in BUDGETS['reject'].items():
+            with self.subTest(model=model.__name__):
+                def prepare(size):
+                    edit_suggestion = self.create_edit_suggestion(model, size)
+                    return lambda: edit_suggestion.edit_suggestion_reject(self.admin_user, 'no')
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_rest_list(self):
+        for basename, budget in REST_BUDGETS['edit-suggestions'].items():
+            with self.subTest(viewset=basename):
+                def prepare(size):
+                    model = REST_MODELS[basename]
+                    parent = self.create_parent(model, 1)
+                    for i in range(size):
+                        parent.edit_suggestions.new(*self.edit_data(model, i + 1))
+                    url = reverse(f'{basename}-edit-suggestions', kwargs={'pk': parent.pk})
+                    return lambda: self.client.get(url, format='json')
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_rest_create(self):
+        self.client.force_authenticate(self.admin_user)
+        for basename, budget in REST_BUDGETS['edit-suggestion-create'].items():
+            with self.subTest(viewset=basename):
+                def prepare(size):
+                    model = REST_MODELS[basename]
+                    parent = self.create_parent(model, size)
+                    data, m2m_data = self.edit_data(model, size)
+                    data['edit_suggestion_reason'] = 'budget'
+                    if model is ForeignKeyModel:
+                        data['foreign'] = data['foreign'].pk
+                    data.update(m2m_data or {})
+                    url = reverse(f'{basename}-edit-suggestion-create', kwargs={'pk': parent.pk})
+
+                    def operation():
+                        response = self.client.post(url, data, format='json')
+                        self.assertEqual(response.status_code, 201)
+
+                    return operation
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_rest_publish(self):
+        self.client.force_authenticate(self.admin_user)
+        for basename, budget in REST_BUDGETS['edit-suggestion-publish'].items():
+            with self.subTest(viewset=basename):
+                def prepare(size):
+                    edit_suggestion = self.create_edit_suggestion(REST_MODELS[basename], size)
+                    url = reverse(f'{basename}-edit-suggestion-publish',
+                                  kwargs={'pk': edit_suggestion.edit_suggestion_parent_id})
+
+                    def operation():
+                        response = self.client.post(url, {'edit_suggestion_id': edit_suggestion.pk}, format='json')
+                        self.assertEqual(response.status_code, 200)
+
+                    return operation
+
+                self.assertQueryBudget(budget, prepare)
+
+    def test_rest_reject(self):
+        self.client.force_authenticate(self.admin_user)
+        for basename, budget in REST_BUDGETS['edit-suggestion-reject'].items():
+            with self.subTest(viewset=basename):
+                def prepare(size):
+                    edit_suggestion = self.create_edit_suggestion(REST_MODELS[basename], size)
+                    url = reverse(f'{basename}-edit-suggestion-reject',
+                                  kwargs={'pk': edit_suggestion.edit_suggestion_parent_id})
+
+                    def operation():
+                        response = self.client.post(url, {
+                            'edit_suggestion_id': edit_suggestion.pk,
+                            'edit_suggestion_reject_reason': 'no',
+                        }, format='json')
+                        self.assertEqual(response.status_code, 200)
+
+                    return operation
+
+                self.assertQueryBudget(budget, prepare)
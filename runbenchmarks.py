@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Benchmarks for django-edit-suggestion using the test models on an in memory SQLite database.
+
+    python runbenchmarks.py storage --size 10000
+    python runbenchmarks.py operations --size 100000 --sample 2000 --output before.json
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+
+from runtests import DEFAULT_SETTINGS
+
+LONG_TEXT = 'lorem ipsum dolor sit amet ' * 200
+
+
+def setup():
+    if not settings.configured:
+        settings.configure(**DEFAULT_SETTINGS)
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def table_size(model):
+    """Bytes used by the table and its indexes"""
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN '
+            '(SELECT name FROM sqlite_master WHERE type = %s AND tbl_name = %s)',
+            [model._meta.db_table, 'index', model._meta.db_table]
+        )
+        return cursor.fetchone()[0] or 0
+
+
+def bench_storage(size):
+    """Full row copies against sparse storage: insert throughput and table size for edits changing one field"""
+    from django_edit_suggestion.tests.models import Article, SparseArticle
+    results = {}
+    for mode, model in (('full', Article), ('sparse', SparseArticle)):
+        model.objects.bulk_create([model(title=f'title {i}', body=LONG_TEXT) for i in range(size)])
+        parents = list(model.objects.all())
+        start = time.perf_counter()
+        for parent in parents:
+            parent.edit_suggestions.new({'title': f'{parent.title} edited', 'body': parent.body})
+        elapsed = time.perf_counter() - start
+        edit_suggestion_model = model.edit_suggestions.model
+        results[mode] = {
+            'inserts_per_second': round(size / elapsed, 2),
+            'parent_table_bytes': table_size(model),
+            'edit_suggestion_table_bytes': table_size(edit_suggestion_model),
+        }
+    return results
+
+
+def bench_async(size, concurrency=50):
+    """
+    Creating and publishing edit suggestions: a sync loop against ``concurrency`` concurrent async tasks.
+    The async calls run inside async_to_sync like under an ASGI server, so the database work stays on one thread
+    """
+    from asgiref.sync import async_to_sync
+    from django.contrib.auth.models import User
+    from django_edit_suggestion.tests.models import SimpleParentModel
+    user = User.objects.create(username='benchmark admin', is_staff=True)
+    SimpleParentModel.objects.bulk_create([SimpleParentModel(name=f'parent {i}') for i in range(size * 2)])
+    parents = list(SimpleParentModel.objects.order_by('pk'))
+    sync_parents, async_parents = parents[:size], parents[size:]
+
+    start = time.perf_counter()
+    for parent in sync_parents:
+        parent.edit_suggestions.new({'name': f'{parent.name} edited'}).edit_suggestion_publish(user)
+    sync_elapsed = time.perf_counter() - start
+
+    async def create_and_publish(parent, semaphore):
+        async with semaphore:
+            instance = await parent.edit_suggestions.anew({'name': f'{parent.name} edited'})
+            await instance.edit_suggestion_apublish(user)
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*[create_and_publish(parent, semaphore) for parent in async_parents])
+
+    start = time.perf_counter()
+    async_to_sync(run_async)()
+    async_elapsed = time.perf_counter() - start
+    return {
+        'sync_operations_per_second': round(size / sync_elapsed, 2),
+        'async_operations_per_second': round(size / async_elapsed, 2),
+        'concurrency': concurrency,
+    }
+
+
+def operation_data(model, rng, tags, children):
+    """Edit suggestion data and m2m data of the test models"""
+    from django_edit_suggestion.tests.models import ParentModel, ParentM2MThroughModel
+    name = f'edited {rng.random()}'
+    if model is ParentModel:
+        return {'name': name, 'second_field': 'second'}, {'tags': [t.pk for t in rng.sample(tags, rng.randint(0, 3))]}
+    if model is ParentM2MThroughModel:
+        return {'name': name}, {'children': [
+            {'pk': child.pk, 'order': order} for order, child in enumerate(rng.sample(children, rng.randint(0, 3)))
+        ]}
+    return {'name': name, 'foreign': rng.choice(children)}, None
+
+
+def bench_operations(size, sample=1000):
+    """
+    Latency percentiles, throughput and query counts of new, list, diff, publish and reject for the models with m2m,
+    m2m through and foreign key. ``size`` edit suggestions are bulk created first (10 by parent), then ``sample``
+    operations of each kind are measured with the instrumentation collector
+    """
+    from django.contrib.auth.models import User
+    from django_edit_suggestion import instrumentation
+    from django_edit_suggestion.models import EditSuggestion
+    from django_edit_suggestion.tests.models import ParentModel, ParentM2MThroughModel, ForeignKeyModel, Tag, \
+        SharedChild
+    from django_edit_suggestion.tests.serializers import ParentSerializer, ParentM2MThroughSerializer, \
+        ForeignKeyModelSerializer
+    serializers = {
+        ParentModel: ParentSerializer,
+        ParentM2MThroughModel: ParentM2MThroughSerializer,
+        ForeignKeyModel: ForeignKeyModelSerializer,
+    }
+    rng = random.Random(0)
+    user = User.objects.create(username='operations admin', is_staff=True)
+    Tag.objects.bulk_create([Tag(name=f'tag {i}') for i in range(20)])
+    SharedChild.objects.bulk_create([SharedChild(name=f'child {i}') for i in range(20)])
+    tags, children = list(Tag.objects.all()), list(SharedChild.objects.all())
+    results = {}
+    for model in (ParentModel, ParentM2MThroughModel, ForeignKeyModel):
+        parent_count = max(size // 10, sample, 1)
+        if model is ParentModel:
+            parents = [model(name=f'parent {i}', excluded_field=0) for i in range(parent_count)]
+        elif model is ForeignKeyModel:
+            parents = [model(name=f'parent {i}', foreign=rng.choice(children)) for i in range(parent_count)]
+        else:
+            parents = [model(name=f'parent {i}') for i in range(parent_count)]
+        model.objects.bulk_create(parents, batch_size=1000)
+        parents = list(model.objects.order_by('pk'))
+
+        def rows():
+            for i in range(size):
+                data, m2m_data = operation_data(model, rng, tags, children)
+                yield parents[i % parent_count], data, m2m_data
+
+        start = time.perf_counter()
+        model.edit_suggestions.bulk_new(rows(), batch_size=1000)
+        bulk_elapsed = time.perf_counter() - start
+
+        collector = instrumentation.InMemoryCollector(sample_size=sample)
+        instrumentation.set_collector(collector)
+        elapsed = {}
+        edit_suggestion_model = model.edit_suggestions.model
+        try:
+            start = time.perf_counter()
+            created = []
+            for parent in parents[:sample]:
+                data, m2m_data = operation_data(model, rng, tags, children)
+                created.append(parent.edit_suggestions.new(data, m2m_data))
+            elapsed['new'] = time.perf_counter() - start
+            # the edit suggestions under review of the parent, serialized with their m2m and foreign values
+            serializer = serializers[model].get_edit_suggestion_serializer()
+            start = time.perf_counter()
+            for parent in parents[:sample]:
+                under_review = parent.edit_suggestions.filter(
+                    edit_suggestion_status=EditSuggestion.Status.UNDER_REVIEWS
+                )
+                with instrumentation.Measure('list', edit_suggestion_model, collector):
+                    serializer(under_review, many=True).data
+            elapsed['list'] = time.perf_counter() - start
+            # loaded again like a request would, without the parent cached by new()
+            pks = [instance.pk for instance in created]
+            to_diff = list(model.edit_suggestions.filter(pk__in=pks))
+            start = time.perf_counter()
+            for instance in to_diff:
+                instance.diff_against_parent()
+            elapsed['diff'] = time.perf_counter() - start
+            half = len(pks) // 2
+            to_publish = list(model.edit_suggestions.filter(pk__in=pks[:half]))
+            start = time.perf_counter()
+            for instance in to_publish:
+                instance.edit_suggestion_publish(user)
+            elapsed['publish'] = time.perf_counter() - start
+            to_reject = list(model.edit_suggestions.filter(pk__in=pks[half:]))
+            start = time.perf_counter()
+            for instance in to_reject:
+                instance.edit_suggestion_reject(user, 'benchmark')
+            elapsed['reject'] = time.perf_counter() - start
+        finally:
+            instrumentation.set_collector(None)
+
+        operations = {'bulk_new': {'count': size, 'operations_per_second': round(size / bulk_elapsed, 2)}}
+        for (operation, label), stats in collector.stats().items():
+            operations[operation] = {
+                'count': stats['count'],
+                'operations_per_second': round(stats['count'] / elapsed[operation], 2),
+                'p50_ms': round(stats['duration_p50'] * 1000, 3),
+                'p90_ms': round(stats['duration_p90'] * 1000, 3),
+                'p99_ms': round(stats['duration_p99'] * 1000, 3),
+                'max_ms': round(stats['duration_max'] * 1000, 3),
+                'queries_p50': stats['queries_p50'],
+                'queries_max': stats['queries_max'],
+                'queries_per_operation': round(stats['queries'] / stats['count'], 2),
+                'rows': stats['rows'],
+            }
+        results[model._meta.label] = operations
+    return results
+
+
+BENCHMARKS = {
+    'storage': bench_storage,
+    'async': bench_async,
+    'operations': bench_operations,
+}
+
+
+def environment():
+    """What the results depend on, to compare runs"""
+    import django
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': __import__('sqlite3').sqlite_version,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', help='one or more of: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--size', type=int, default=1000, help='number of parents/edit suggestions')
+    parser.add_argument('--sample', type=int, default=1000, help='operations measured by the operations benchmark')
+    parser.add_argument('--output', '-o', help='also write the results to this json file')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+    setup()
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        benchmark = BENCHMARKS[name]
+        options = {}
+        if 'sample' in inspect.signature(benchmark).parameters:
+            options['sample'] = args.sample
+        results[name] = benchmark(args.size, **options)
+    results['environment'] = dict(environment(), size=args.size, sample=args.sample)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,11 @@ setup(
     author='Vladimir Gorea',
     author_email='vladimir.gorea@gmail.com',
     license='MIT',
-    packages=['django_edit_suggestion'],
+    packages=[
+        'django_edit_suggestion',
+        'django_edit_suggestion.management',
+        'django_edit_suggestion.management.commands',
+    ],
     install_requires=[], # packages listed here will be automatically installed
 
     classifiers=[